@@ -0,0 +1,363 @@
+"""
+bench.py
+
+Offline benchmark for the YouTube monitor.
+Starts local stand-ins for the YouTube RSS endpoint and a Discord
+webhook, then runs full check_youtube() cycles against N synthetic
+channels and reports throughput, per-channel latency, peak RSS and
+CPU time. Nothing leaves the machine.
+
+Usage:
+    python bench.py                          # 100, 1000 and 10000 channels
+    python bench.py -n 500 --cycles 5 --latency 0.05 --error-rate 0.01
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import logging
+import resource
+import tempfile
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from urllib.parse import urlparse, parse_qs
+
+# Each benchmark runs in a fresh process so RSS and CPU are per run
+_ctx = multiprocessing.get_context("spawn")
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Pooled client connections are dropped when a run's process exits
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+# ================= FAKE YOUTUBE =================
+
+FEED_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" '
+    'xmlns:media="http://search.yahoo.com/mrss/" xmlns="http://www.w3.org/2005/Atom">\n'
+    '<title>{channel_id}</title>\n'
+)
+
+FEED_ENTRY = (
+    '<entry>\n'
+    '<id>yt:video:{video_id}</id>\n'
+    '<yt:videoId>{video_id}</yt:videoId>\n'
+    '<yt:channelId>{channel_id}</yt:channelId>\n'
+    '<title>Video {n}</title>\n'
+    '<published>{published}</published>\n'
+    '<updated>{published}</updated>\n'
+    '<media:group>\n'
+    '<media:thumbnail url="https://i.ytimg.com/vi/{video_id}/hqdefault.jpg" width="480" height="360"/>\n'
+    '<media:description>{padding}</media:description>\n'
+    '</media:group>\n'
+    '</entry>\n'
+)
+
+
+class _FakeYouTubeHandler(BaseHTTPRequestHandler):
+    """Serves /feeds/videos.xml?channel_id=... from a synthetic upload timeline."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        opts = self.server.opts
+        channel_id = parse_qs(urlparse(self.path).query).get("channel_id", [None])[0]
+        if not channel_id:
+            self._reply(404)
+            return
+
+        if opts["latency"]:
+            time.sleep(random.expovariate(1 / opts["latency"]))
+
+        if random.random() < opts["error_rate"]:
+            self._reply(500)
+            return
+
+        # Advance the channel's timeline to simulate a new upload
+        with self.server.lock:
+            generation = self.server.generations.get(channel_id, 0)
+            if random.random() < opts["upload_rate"]:
+                generation += 1
+                self.server.generations[channel_id] = generation
+
+        etag = f'"{channel_id}-{generation}"'
+        if self.headers.get("If-None-Match") == etag and random.random() < opts["not_modified_rate"]:
+            self._reply(304, headers={"ETag": etag})
+            return
+
+        self._reply(200, self.server.render_feed(channel_id, generation), {
+            "Content-Type": "application/atom+xml; charset=UTF-8",
+            "ETag": etag,
+        })
+
+
+class FakeYouTube(_QuietServer):
+    def __init__(self, address, opts):
+        super().__init__(address, _FakeYouTubeHandler)
+        self.opts = opts
+        self.lock = Lock()
+        self.generations = {}
+
+        # Pad each entry so a full feed is roughly feed_bytes long
+        entries = max(1, opts["feed_entries"])
+        self.padding = "x" * max(0, opts["feed_bytes"] // entries - len(FEED_ENTRY))
+
+    def render_feed(self, channel_id, generation):
+        parts = [FEED_HEAD.format(channel_id=channel_id)]
+        newest = generation + self.opts["feed_entries"]
+        for n in range(newest, generation, -1):
+            published = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(1_600_000_000 + n * 86400))
+            parts.append(FEED_ENTRY.format(
+                video_id=f"{channel_id[-6:]}{n:05d}", channel_id=channel_id, n=n,
+                published=published, padding=self.padding,
+            ))
+        parts.append("</feed>\n")
+        return "".join(parts).encode()
+
+
+# ================= FAKE DISCORD =================
+
+class _FakeDiscordHandler(BaseHTTPRequestHandler):
+    """Accepts webhook POSTs, answering 429 at the configured rate."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        opts = self.server.opts
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if random.random() < opts["rate_limit_rate"]:
+            with self.server.stats.get_lock():
+                self.server.stats[1] += 1
+            retry_after = opts["retry_after"]
+            self._reply(429, json.dumps({"retry_after": retry_after, "global": False}).encode(), {
+                "Content-Type": "application/json",
+                "Retry-After": str(retry_after),
+                "X-RateLimit-Scope": "user",
+            })
+            return
+
+        with self.server.stats.get_lock():
+            self.server.stats[0] += len(payload.get("embeds", []))
+        self._reply(204, headers={
+            "X-RateLimit-Limit": "5",
+            "X-RateLimit-Remaining": "4",
+            "X-RateLimit-Reset-After": "0.1",
+        })
+
+
+class FakeDiscord(_QuietServer):
+    def __init__(self, address, opts, stats):
+        super().__init__(address, _FakeDiscordHandler)
+        self.opts = opts
+        self.stats = stats
+
+
+def serve_fakes(opts, stats, ready):
+    """Run both stand-in servers until the process is terminated."""
+    youtube = FakeYouTube(("127.0.0.1", 0), opts)
+    discord = FakeDiscord(("127.0.0.1", 0), opts, stats)
+    Thread(target=discord.serve_forever, daemon=True).start()
+    ready.put((youtube.server_address[1], discord.server_address[1]))
+    youtube.serve_forever()
+
+
+# ================= BENCHMARK RUN =================
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_benchmark(n, opts, feed_url, webhook_url, results):
+    """Run warm-up plus opts["cycles"] timed cycles against n channels (child process)."""
+    workdir = tempfile.mkdtemp(prefix="bench-")
+
+    # Configure before any bot module reads its environment
+    os.environ.update({
+        "YOUTUBE_FEED_URL": feed_url,
+        "BENCH_WEBHOOK": webhook_url,
+        "POLL_MAX_IN_FLIGHT": str(opts["in_flight"]),
+        "POLL_MAX_PER_HOST": str(opts["in_flight"]),
+        "POLL_MAX_RPS": "0",
+        "WEBSUB_ENABLED": "false",
+        "METRICS_PORT": "0",
+        "DISCORD_BATCH_WINDOW": "0.2",
+        "OUTBOX_POLL_INTERVAL": "0.5",
+    })
+
+    logging.basicConfig(level=logging.WARNING if opts["verbose"] else logging.CRITICAL)
+
+    import db
+    db.DB_PATH = os.path.join(workdir, "bench.db")
+    db.init_db()
+
+    import channel_cache
+    channel_cache.CACHE_FILE = os.path.join(workdir, "channel_cache.json")
+
+    import monitor_youtube
+    from monitor_youtube import check_youtube, youtube_scheduler
+    from dispatcher import dispatcher
+    from outbox import outbox_worker
+
+    # Poll every channel on every cycle
+    youtube_scheduler.fixed_interval = 0.001
+
+    with db.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO channels (name, url, webhook_env) VALUES (?, ?, 'BENCH_WEBHOOK')",
+            [(f"bench-{i}", f"https://www.youtube.com/channel/UCbench{i:016d}") for i in range(n)],
+        )
+
+    # Time each feed fetch as the worker thread sees it
+    latencies = []
+    fetch_channel = monitor_youtube.fetch_channel
+
+    def timed_fetch_channel(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fetch_channel(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    monitor_youtube.fetch_channel = timed_fetch_channel
+    outbox_worker.start()
+
+    # First run only caches the newest video per channel
+    check_youtube()
+    latencies.clear()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(opts["cycles"]):
+        check_youtube()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    # Let the outbox drain so delivery cost shows up in CPU and RSS
+    drain_start = time.perf_counter()
+    deadline = time.monotonic() + opts["drain_timeout"]
+    while time.monotonic() < deadline and (db.count_outbox() or dispatcher.pending()):
+        outbox_worker.wake()
+        time.sleep(0.1)
+    outbox_worker.stop(timeout=5)
+    dispatcher.flush(timeout=5)
+    outbox_worker.record_outcomes()
+    drain = time.perf_counter() - drain_start
+
+    results.put({
+        "channels": n,
+        "cycles_per_sec": opts["cycles"] / wall if wall else 0.0,
+        "cycle_seconds": wall / max(1, opts["cycles"]),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "cpu_seconds": cpu,
+        "drain_seconds": drain,
+        "undelivered": db.count_outbox(),
+    })
+
+
+# ================= CLI =================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for check_youtube().")
+    parser.add_argument("-n", "--channels", type=int, nargs="+", default=[100, 1000, 10000],
+                        help="channel counts to benchmark (default: 100 1000 10000)")
+    parser.add_argument("--cycles", type=int, default=3, help="timed cycles per run (default: 3)")
+    parser.add_argument("--in-flight", type=int, default=10, help="concurrent feed fetches (default: 10)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="mean fake feed latency in seconds (default: 0.05)")
+    parser.add_argument("--feed-entries", type=int, default=15, help="entries per feed (default: 15)")
+    parser.add_argument("--feed-bytes", type=int, default=40_000,
+                        help="approximate full feed size in bytes (default: 40000)")
+    parser.add_argument("--not-modified-rate", type=float, default=0.8,
+                        help="chance of a 304 when the client's ETag is current (default: 0.8)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance of a feed 500 (default: 0)")
+    parser.add_argument("--upload-rate", type=float, default=0.02,
+                        help="chance a feed request reveals a new upload (default: 0.02)")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.05,
+                        help="chance of a webhook 429 (default: 0.05)")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="429 retry_after seconds (default: 0.5)")
+    parser.add_argument("--drain-timeout", type=float, default=60,
+                        help="seconds to wait for queued notifications after the cycles (default: 60)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show bot warnings and errors")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = vars(parse_args(argv))
+
+    stats = _ctx.Array("i", 2)  # [embeds delivered, 429s sent]
+    ready = _ctx.Queue()
+    fakes = _ctx.Process(target=serve_fakes, args=(opts, stats, ready), daemon=True)
+    fakes.start()
+    youtube_port, discord_port = ready.get(timeout=10)
+
+    feed_url = f"http://127.0.0.1:{youtube_port}/feeds/videos.xml"
+    webhook_url = f"http://127.0.0.1:{discord_port}/api/webhooks/1/bench"
+
+    header = (f"{'channels':>9} {'cycles/s':>9} {'cycle s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+              f"{'RSS MiB':>8} {'CPU s':>7} {'drain s':>8} {'embeds':>7} {'429s':>5}")
+    print(header)
+    print("-" * len(header))
+
+    try:
+        for n in opts["channels"]:
+            before = list(stats)
+            results = _ctx.Queue()
+            worker = _ctx.Process(target=run_benchmark, args=(n, opts, feed_url, webhook_url, results))
+            worker.start()
+            worker.join()
+            if worker.exitcode != 0:
+                print(f"{n:>9} benchmark process failed (exit code {worker.exitcode})")
+                continue
+
+            r = results.get()
+            embeds, limited = stats[0] - before[0], stats[1] - before[1]
+            print(f"{r['channels']:>9} {r['cycles_per_sec']:>9.3f} {r['cycle_seconds']:>8.2f} "
+                  f"{r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['peak_rss_mib']:>8.1f} "
+                  f"{r['cpu_seconds']:>7.2f} {r['drain_seconds']:>8.2f} {embeds:>7} {limited:>5}")
+            if r["undelivered"]:
+                print(f"{'':>9} warning: {r['undelivered']} notifications still in the outbox")
+    finally:
+        fakes.terminate()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,31 +5,58 @@ Handles resolving and caching YouTube channel IDs.
 
 import json
 import os
-import requests
+import time
 import logging
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from threading import Lock
 
+import http_client
+from db import get_channel_ids, save_channel_ids_many, get_quota_usage, add_quota_usage
+from poller import poll_all
+from metrics import RESOLVE_SECONDS, RESOLVE_LOOKUPS
+
 # Load .env variables
 load_dotenv()
 
 API_KEY = os.getenv("YOUTUBE_API_KEY")
+API_HOST = "www.googleapis.com"
+
+# Data API quota (units per day); search stops at its own lower threshold
+QUOTA_DAILY_LIMIT = int(os.getenv("YOUTUBE_QUOTA_DAILY_LIMIT", 10000))
+SEARCH_QUOTA_LIMIT = int(os.getenv("YOUTUBE_SEARCH_QUOTA_LIMIT", 2000))
+QUOTA_COST_CHANNELS = 1
+QUOTA_COST_SEARCH = 100
+QUOTA_TZ = timezone(timedelta(hours=-8))
+
+# Seconds before an unresolvable channel URL is retried
+NEGATIVE_CACHE_TTL = int(os.getenv("CHANNEL_NEGATIVE_CACHE_TTL", 6 * 3600))
 
 # Base directory (project root)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Legacy JSON cache, imported into SQLite on first load
 CACHE_FILE = os.path.join(BASE_DIR, "data/channel_cache.json")
 
-HEADERS = {"User-Agent": "Mozilla/5.0"}
+# Flush dirty entries to SQLite once this many have piled up
+CACHE_FLUSH_BATCH = int(os.getenv("CHANNEL_CACHE_FLUSH_BATCH", 25))
 
-# Thread-safe lock (future-proofing for async/multi-monitor)
+# In-memory cache {url: channel_id}, loaded once from SQLite.
+# Reads are plain dict lookups; the lock only guards loading and writes.
+_cache = None
+_dirty = {}
 _cache_lock = Lock()
 
+# Failed URLs {url: monotonic expiry}
+_negative_cache = {}
+_quota_lock = Lock()
+
 # Logger
 logger = logging.getLogger("discord_monitor.channel_cache")
 
 
-def load_cache():
-    """Load cached channel IDs safely."""
+def _load_legacy_json():
+    """Read the old channel_cache.json, if any, for a one-off migration."""
     if not os.path.exists(CACHE_FILE):
         return {}
 
@@ -37,100 +64,237 @@ def load_cache():
         with open(CACHE_FILE, "r") as f:
             return json.load(f)
     except json.JSONDecodeError:
-        logger.warning("channel_cache.json is corrupted. Resetting cache.")
+        logger.warning("channel_cache.json is corrupted. Ignoring it.")
         return {}
 
 
-def save_cache(cache):
-    """Save channel ID cache safely with atomic write."""
-    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+def load_cache():
+    """Return the in-memory cache, loading it from SQLite on first use."""
+    global _cache
+
+    cache = _cache
+    if cache is not None:
+        return cache
+
+    with _cache_lock:
+        if _cache is None:
+            cache = get_channel_ids()
+            if not cache:
+                legacy = _load_legacy_json()
+                if legacy:
+                    logger.info(f"Migrating {len(legacy)} entries from channel_cache.json")
+                    cache.update(legacy)
+                    _dirty.update(legacy)
+            _cache = cache
+        return _cache
+
+
+def flush_cache():
+    """Write dirty cache entries to SQLite in one transaction."""
+    with _cache_lock:
+        if not _dirty:
+            return
+        items = list(_dirty.items())
+        _dirty.clear()
 
-    temp_file = CACHE_FILE + ".tmp"
-    with open(temp_file, "w") as f:
-        json.dump(cache, f, indent=4)
+    save_channel_ids_many(items)
+    logger.debug(f"Flushed {len(items)} channel IDs to database")
 
-    # Atomic replace (prevents corruption)
-    os.replace(temp_file, CACHE_FILE)
 
+def _store(url, channel_id):
+    """Cache a resolved ID in memory and queue it for write-behind."""
+    cache = load_cache()
+    with _cache_lock:
+        cache[url] = channel_id
+        _dirty[url] = channel_id
+        pending = len(_dirty)
 
-def resolve_channel_id(url):
+    if pending >= CACHE_FLUSH_BATCH:
+        flush_cache()
+
+
+def seed_cache(items):
+    """Cache already known (url, channel_id) pairs, e.g. from an exported snapshot."""
+    for url, channel_id in items:
+        if channel_id:
+            _store(url, channel_id)
+
+
+# ================= API QUOTA =================
+
+def _quota_day():
+    """Current quota day (YouTube resets quota at midnight Pacific)."""
+    return datetime.now(QUOTA_TZ).strftime("%Y-%m-%d")
+
+
+def spend_quota(units, limit=None):
     """
-    Resolve channel ID using YouTube API once, then cache it forever.
-    Supports @handle URLs and direct channel IDs.
+    Reserve Data API units for a call.
+    Returns False (and spends nothing) if the call would push today's
+    usage past limit (default: YOUTUBE_QUOTA_DAILY_LIMIT).
     """
+    limit = QUOTA_DAILY_LIMIT if limit is None else limit
+    day = _quota_day()
 
-    with _cache_lock:
-        cache = load_cache()
+    with _quota_lock:
+        used = get_quota_usage(day)
+        if used + units > limit:
+            return False
+        add_quota_usage(day, units)
+        return True
+
+
+# ================= RESOLUTION =================
+
+def _is_negative_cached(url):
+    expires = _negative_cache.get(url)
+    return expires is not None and expires > time.monotonic()
+
+
+def _api_get(url):
+    """
+    GET a Data API URL and return its JSON; raise on HTTP or API errors.
+    Errors name the status, not the URL, which carries the API key.
+    """
+    response = http_client.get(url)
+    try:
+        data = response.json()
+    except ValueError:
+        data = {}
+
+    error = data.get("error") if isinstance(data, dict) else None
+    if response.status_code >= 400 or error:
+        message = error.get("message") if isinstance(error, dict) else error
+        raise RuntimeError(f"YouTube API returned {response.status_code}: {message or response.reason}")
+    return data
+
+
+def _lookup_handle(handle):
+    """
+    Resolve a single @handle via the Data API.
+    Uses channels.list (1 unit), then search (100 units) only while
+    today's usage is under YOUTUBE_SEARCH_QUOTA_LIMIT.
+    Returns the channel ID, or None if the API has no such channel.
+    Raises on request failures, API error responses (quotaExceeded,
+    keyInvalid, 5xx) or an exhausted quota, so the handle is retried
+    next time rather than negative-cached.
+    """
+    logger.info("Resolving channel ID via API for handle: %s", handle)
+
+    if not spend_quota(QUOTA_COST_CHANNELS):
+        raise RuntimeError("YouTube API daily quota reached")
+
+    # 1️⃣ Try handle lookup
+    api_url = (
+        f"https://{API_HOST}/youtube/v3/channels"
+        f"?part=id&forHandle={handle}&key={API_KEY}"
+    )
+
+    response = _api_get(api_url)
+
+    if response.get("items"):
+        return response["items"][0]["id"]
+
+    # 2️⃣ Fallback search if handle fails
+    if not spend_quota(QUOTA_COST_SEARCH, limit=SEARCH_QUOTA_LIMIT):
+        raise RuntimeError("search quota budget reached")
+
+    logger.warning("Handle lookup failed, searching channel name: %s", handle)
+
+    search_url = (
+        f"https://{API_HOST}/youtube/v3/search"
+        f"?part=snippet&type=channel&q={handle}&maxResults=1&key={API_KEY}"
+    )
+
+    search = _api_get(search_url)
+
+    if search.get("items"):
+        return search["items"][0]["snippet"]["channelId"]
+
+    return None
+
+
+def resolve_channel_ids(urls):
+    """
+    Resolve many channel URLs at once.
+    Cached and direct /channel/ URLs resolve locally; the remaining
+    handles are deduplicated and looked up concurrently. Handles that
+    fail are not retried until NEGATIVE_CACHE_TTL has passed.
+    Returns {url: channel_id or None}.
+    """
+    with RESOLVE_SECONDS.time():
+        return _resolve_channel_ids(urls)
+
+
+def _resolve_channel_ids(urls):
+    cache = load_cache()
+    resolved = {}
+    handles = {}
 
+    for url in dict.fromkeys(urls):
         # Return cached value instantly
-        if url in cache:
-            logger.debug(f"Using cached channel ID for {url}")
-            return cache[url]
+        channel_id = cache.get(url)
+        if channel_id:
+            RESOLVE_LOOKUPS.inc(source="cache")
+            resolved[url] = channel_id
+            continue
 
         # If user pasted a channel ID directly
         if "/channel/" in url:
             channel_id = url.split("/channel/")[-1]
-            cache[url] = channel_id
-            save_cache(cache)
-            logger.info(f"Cached direct channel ID for {url}")
-            return channel_id
+            _store(url, channel_id)
+            logger.info("Cached direct channel ID for %s", url)
+            RESOLVE_LOOKUPS.inc(source="direct")
+            resolved[url] = channel_id
+            continue
+
+        resolved[url] = None
 
         # Extract handle safely
-        if "@" in url:
-            handle = url.split("@")[-1]
-        else:
-            logger.error(f"Invalid YouTube URL: {url}")
-            return None
-
-        if not API_KEY:
-            logger.error("YOUTUBE_API_KEY missing in .env")
-            return None
-
-        logger.info(f"Resolving channel ID via API for handle: {handle}")
-
-        # 1️⃣ Try handle lookup
-        api_url = (
-            f"https://www.googleapis.com/youtube/v3/channels"
-            f"?part=id&forHandle={handle}&key={API_KEY}"
-        )
-
-        try:
-            response = requests.get(api_url, headers=HEADERS, timeout=10).json()
-        except Exception as e:
-            logger.exception(f"YouTube API request failed: {e}")
-            return None
-
-        channel_id = None
-
-        if response.get("items"):
-            channel_id = response["items"][0]["id"]
-
-        # 2️⃣ Fallback search if handle fails
-        if not channel_id:
-            logger.warning(f"Handle lookup failed, searching channel name: {handle}")
-
-            search_url = (
-                f"https://www.googleapis.com/youtube/v3/search"
-                f"?part=snippet&type=channel&q={handle}&maxResults=1&key={API_KEY}"
-            )
-
-            try:
-                search = requests.get(search_url, headers=HEADERS, timeout=10).json()
-            except Exception as e:
-                logger.exception(f"YouTube search failed: {e}")
-                return None
-
-            if search.get("items"):
-                channel_id = search["items"][0]["snippet"]["channelId"]
-
-        # If still failed
-        if not channel_id:
-            logger.error(f"Could not resolve channel ID for {url}")
-            return None
-
-        # Cache result
-        cache[url] = channel_id
-        save_cache(cache)
+        if "@" not in url:
+            logger.error("Invalid YouTube URL: %s", url)
+            continue
+
+        if _is_negative_cached(url):
+            logger.debug("Skipping recently failed channel: %s", url)
+            continue
+
+        handles.setdefault(url.split("@")[-1], []).append(url)
+
+    if not handles:
+        return resolved
+
+    if not API_KEY:
+        logger.error("YOUTUBE_API_KEY missing in .env")
+        return resolved
+
+    results = poll_all(handles, fetch=_lookup_handle, host_of=lambda handle: API_HOST)
+
+    for handle, channel_id, error in results:
+        if error:
+            logger.error("YouTube API lookup failed for %s: %s", handle, error)
+            continue
+
+        for url in handles[handle]:
+            if not channel_id:
+                logger.error("Could not resolve channel ID for %s", url)
+                RESOLVE_LOOKUPS.inc(source="failed")
+                _negative_cache[url] = time.monotonic() + NEGATIVE_CACHE_TTL
+                continue
 
-        logger.info(f"Cached YouTube handle {handle} → {channel_id}")
-        return channel_id
+            # Cache result (written to SQLite on the next flush)
+            _negative_cache.pop(url, None)
+            _store(url, channel_id)
+            resolved[url] = channel_id
+            RESOLVE_LOOKUPS.inc(source="api")
+            logger.info("Cached YouTube handle %s → %s", handle, channel_id)
+
+    return resolved
+
+
+def resolve_channel_id(url):
+    """
+    Resolve channel ID using YouTube API once, then cache it forever.
+    Supports @handle URLs and direct channel IDs.
+    """
+    return resolve_channel_ids([url])[url]
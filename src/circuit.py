@@ -0,0 +1,163 @@
+"""
+circuit.py
+
+Circuit breakers for outbound requests.
+HostBreaker tracks a rolling error rate per host and, once it trips,
+fails calls immediately instead of letting every channel wait out its
+timeout. After a cooldown one probe request is let through (half-open);
+success closes the circuit, failure reopens it with a longer cooldown.
+FailureBackoff skips individual keys (e.g. a channel whose feed keeps
+404ing) for exponentially growing periods.
+"""
+
+import os
+import time
+import logging
+from collections import deque
+from threading import Lock
+from dotenv import load_dotenv
+
+import requests
+
+from metrics import CIRCUIT_SHORT_CIRCUITS, CIRCUIT_OPEN
+
+load_dotenv()
+
+# Rolling window (seconds) and minimum calls in it before the error rate counts
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", 60))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", 10))
+
+# Error rate (0-1) that opens a host's circuit
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", 0.5))
+
+# First open period, doubled on each failed probe up to the max (seconds)
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", 30))
+CIRCUIT_MAX_COOLDOWN = float(os.getenv("CIRCUIT_MAX_COOLDOWN", 600))
+
+# Per-channel backoff after repeated feed failures (seconds)
+FEED_FAILURE_BACKOFF = float(os.getenv("FEED_FAILURE_BACKOFF", 600))
+FEED_FAILURE_BACKOFF_MAX = float(os.getenv("FEED_FAILURE_BACKOFF_MAX", 86400))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+logger = logging.getLogger("discord_monitor.circuit")
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised instead of sending a request to a host whose circuit is open."""
+
+
+class HostBreaker:
+    """Rolling-window circuit breaker for one host."""
+
+    def __init__(self, host):
+        self.host = host
+        self.state = CLOSED
+        self._calls = deque()  # (monotonic time, ok)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._cooldown = CIRCUIT_COOLDOWN
+        self._probing = False
+        self._lock = Lock()
+
+    def allow(self, now=None):
+        """True if a request may be sent now. A half-open circuit admits one probe."""
+        now = now or time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now - self._opened_at >= self._cooldown:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, ok, now=None):
+        """Record the outcome of a request that was allowed through."""
+        now = now or time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if ok:
+                    self._close()
+                else:
+                    self._open(now, self._cooldown * 2)
+                return
+            if self.state == OPEN:
+                # Stragglers sent before the circuit opened
+                return
+
+            self._calls.append((now, ok))
+            self._failures += not ok
+            while self._calls and now - self._calls[0][0] > CIRCUIT_WINDOW:
+                self._failures -= not self._calls.popleft()[1]
+
+            if (self.state == CLOSED and len(self._calls) >= CIRCUIT_MIN_CALLS
+                    and self._failures / len(self._calls) >= CIRCUIT_ERROR_RATE):
+                self._open(now, CIRCUIT_COOLDOWN)
+
+    def _open(self, now, cooldown):
+        self.state = OPEN
+        self._opened_at = now
+        self._cooldown = min(cooldown, CIRCUIT_MAX_COOLDOWN)
+        self._calls.clear()
+        self._failures = 0
+        CIRCUIT_OPEN.set(1, host=self.host)
+        logger.warning(f"Circuit open for {self.host}, cooling down {self._cooldown:.0f}s")
+
+    def _close(self):
+        self.state = CLOSED
+        self._cooldown = CIRCUIT_COOLDOWN
+        CIRCUIT_OPEN.set(0, host=self.host)
+        logger.info(f"Circuit closed for {self.host}")
+
+
+_breakers = {}
+_breakers_lock = Lock()
+
+
+def breaker_for(host):
+    """Return the shared breaker for a host."""
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = HostBreaker(host)
+        return breaker
+
+
+def check_host(host):
+    """Raise CircuitOpenError if requests to host should not be sent now."""
+    if not breaker_for(host).allow():
+        CIRCUIT_SHORT_CIRCUITS.inc(host=host)
+        raise CircuitOpenError(f"circuit open for {host}")
+
+
+class FailureBackoff:
+    """Exponential per-key backoff after consecutive failures."""
+
+    def __init__(self, base=FEED_FAILURE_BACKOFF, maximum=FEED_FAILURE_BACKOFF_MAX):
+        self.base = base
+        self.maximum = maximum
+        self._state = {}  # key -> (consecutive failures, retry at)
+        self._lock = Lock()
+
+    def blocked(self, key, now):
+        with self._lock:
+            state = self._state.get(key)
+            return state is not None and now < state[1]
+
+    def failure(self, key, now):
+        """Record a failure and return the seconds until key is retried."""
+        with self._lock:
+            failures = self._state.get(key, (0, 0))[0] + 1
+            delay = min(self.base * 2 ** (failures - 1), self.maximum)
+            self._state[key] = (failures, now + delay)
+            return delay
+
+    def success(self, key):
+        with self._lock:
+            self._state.pop(key, None)
@@ -0,0 +1,104 @@
+"""
+config.py
+
+Hot-reloaded view of the channel list and webhook URLs.
+Instead of re-parsing .env and re-reading the channels table every
+cycle, the watcher compares cheap change markers (the .env file's
+mtime/inode/size and SQLite's PRAGMA data_version plus a trigger-bumped
+config_version) and only reloads what changed. Readers get an immutable
+ConfigSnapshot that is swapped in atomically, so edits made with
+manage.py apply within seconds without a restart.
+"""
+
+import os
+import logging
+from threading import Lock, local
+from dotenv import dotenv_values
+
+from db import get_channels, get_data_version, get_config_version
+
+# Project .env (the file manage.py writes webhooks to)
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENV_FILE = os.path.join(BASE_DIR, ".env")
+
+logger = logging.getLogger("discord_monitor.config")
+
+
+class ConfigSnapshot:
+    """Channels and their webhook URLs as of one reload. Do not mutate."""
+
+    def __init__(self, channels, webhooks):
+        self.channels = channels
+        self.webhooks = webhooks
+
+    def webhook_url(self, webhook_env):
+        return self.webhooks.get(webhook_env)
+
+
+class ConfigWatcher:
+    """Reloads the snapshot when .env or the channels table changes."""
+
+    def __init__(self, env_file=ENV_FILE):
+        self.env_file = env_file
+        self._lock = Lock()
+        self._env_signature = None
+        self._config_version = None
+        self._snapshot = None
+
+        # data_version is per connection, and connections are per thread
+        self._seen = local()
+
+    def _env_stat(self):
+        try:
+            st = os.stat(self.env_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _reload_env(self):
+        # Same effect as load_dotenv(override=True), but only when the file changed
+        values = dotenv_values(self.env_file)
+        os.environ.update({k: v for k, v in values.items() if v is not None})
+
+    def poll(self):
+        """Reload whatever changed since the last poll. Returns True if anything did."""
+        with self._lock:
+            env_signature = self._env_stat()
+            env_changed = env_signature != self._env_signature
+
+            # data_version moves on any commit by another connection; only
+            # then is the (single row) config_version worth reading
+            data_version = get_data_version()
+            db_changed = self._snapshot is None
+            if data_version != getattr(self._seen, "data_version", None):
+                self._seen.data_version = data_version
+                config_version = get_config_version()
+                db_changed = db_changed or config_version != self._config_version
+                self._config_version = config_version
+
+            if not env_changed and not db_changed:
+                return False
+
+            if env_changed:
+                self._env_signature = env_signature
+                if env_signature is not None:
+                    self._reload_env()
+
+            channels = get_channels() if db_changed else self._snapshot.channels
+            webhooks = {c["webhook_env"]: os.getenv(c["webhook_env"]) for c in channels}
+            first = self._snapshot is None
+            self._snapshot = ConfigSnapshot(channels, webhooks)
+
+        if not first:
+            changed = " and ".join(n for n, c in ((".env", env_changed), ("channels", db_changed)) if c)
+            logger.info(f"Reloaded configuration ({changed} changed): {len(channels)} channels")
+        return True
+
+    def current(self):
+        """Return the latest snapshot, reloading first if anything changed."""
+        self.poll()
+        return self._snapshot
+
+
+# Shared watcher for the whole bot
+config_watcher = ConfigWatcher()
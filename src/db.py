@@ -6,17 +6,51 @@ Handles SQLite database for Discord Monitor Bot.
 
 import sqlite3
 import os
+import json
+import time
+import threading
 
 # Base directory of project
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "data/discord_monitor.db")
 
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 128
+
+# One long-lived connection per thread
+_local = threading.local()
+
+
+# ================= CONNECTION =================
+
+def get_connection():
+    """
+    Return this thread's long-lived connection, opening it on first use.
+    Connections run in WAL mode with synchronous=NORMAL, so readers never
+    block the writer and commits don't fsync the main database file.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+def close_db():
+    """Close this thread's connection, if open."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
 
 def init_db():
     """Create database and tables if they do not exist."""
     os.makedirs(os.path.join(BASE_DIR, "data"), exist_ok=True)
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
 
     # Channels table
@@ -39,63 +73,230 @@ def init_db():
         )
     """)
 
+    # Bounded per-channel history of seen item IDs (see seen.py).
+    # The primary key answers "seen before?"; the index lists a channel's
+    # items by age for loading and compaction without touching the table.
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS seen_items (
+            platform TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            first_seen_ts REAL NOT NULL,
+            PRIMARY KEY (platform, channel, item_id)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS seen_items_by_age
+        ON seen_items (platform, channel, first_seen_ts, item_id)
+    """)
+
+    # Feed validators for conditional GET (ETag / Last-Modified)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS feed_cache (
+            channel_id TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT
+        )
+    """)
+
+    # Resolved YouTube channel IDs, keyed by configured URL
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS channel_ids (
+            url TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL
+        )
+    """)
+
+    # YouTube Data API units spent per quota day
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS api_quota (
+            day TEXT PRIMARY KEY,
+            units INTEGER NOT NULL
+        )
+    """)
+
+    # Notification outbox (written with last_seen, drained by outbox.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            webhook_env TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            claimed_at REAL
+        )
+    """)
+    # Databases created before claims were timestamped
+    if "claimed_at" not in {r[1] for r in c.execute("PRAGMA table_info(outbox)")}:
+        c.execute("ALTER TABLE outbox ADD COLUMN claimed_at REAL")
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due
+        ON outbox (status, next_attempt_at, id)
+    """)
+
+    # Adaptive polling state per channel (see scheduler.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS poll_schedule (
+            platform TEXT,
+            channel_url TEXT,
+            next_due REAL NOT NULL,
+            mean_gap REAL,
+            last_upload REAL,
+            hours TEXT,
+            PRIMARY KEY (platform, channel_url)
+        )
+    """)
+
+    # WebSub subscription leases per YouTube channel ID
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS websub_leases (
+            channel_id TEXT PRIMARY KEY,
+            lease_expires REAL NOT NULL
+        )
+    """)
+
+    # Watched subreddits (see monitor_reddit.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS subreddits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE COLLATE NOCASE,
+            webhook_env TEXT
+        )
+    """)
+
+    # Watched web pages (see monitor_websites.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS websites (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE,
+            url TEXT UNIQUE,
+            selector TEXT,
+            webhook_env TEXT
+        )
+    """)
+
+    # Last fingerprint per page: validators, SimHash and packed block hashes
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS website_state (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            simhash TEXT,
+            blocks TEXT,
+            checked_at REAL,
+            changed_at REAL
+        )
+    """)
+
+    # Bumped by triggers whenever the channel list changes (see config.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS config_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL
+        )
+    """)
+    c.execute("INSERT OR IGNORE INTO config_version (id, version) VALUES (0, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS channels_{event.lower()}_version
+            AFTER {event} ON channels
+            BEGIN
+                UPDATE config_version SET version = version + 1 WHERE id = 0;
+            END
+        """)
+
+    # Live bot replicas for lease-based sharding (see sharding.py)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            joined_at REAL NOT NULL,
+            heartbeat REAL NOT NULL
+        )
+    """)
+
     conn.commit()
-    conn.close()
 
 
 # ================= CHANNELS =================
 
 def add_channel(name, url, webhook_env):
     """Add a new channel to the database."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    conn = get_connection()
     try:
-        c.execute(
-            "INSERT INTO channels (name, url, webhook_env) VALUES (?, ?, ?)",
-            (name, url, webhook_env)
-        )
+        with conn:
+            conn.execute(
+                "INSERT INTO channels (name, url, webhook_env) VALUES (?, ?, ?)",
+                (name, url, webhook_env)
+            )
     except sqlite3.IntegrityError:
         print(f"[INFO] Channel '{name}' already exists in the database, skipping.")
-    conn.commit()
-    conn.close()
+
+
+def add_channels_many(channels):
+    """
+    Add many channels in one transaction, skipping names or URLs that
+    already exist. channels is an iterable of (name, url, webhook_env).
+    Returns the number of channels inserted.
+    """
+    conn = get_connection()
+    count = "SELECT COUNT(*) FROM channels"
+    with conn:
+        before = conn.execute(count).fetchone()[0]
+        conn.executemany(
+            "INSERT OR IGNORE INTO channels (name, url, webhook_env) VALUES (?, ?, ?)",
+            list(channels)
+        )
+        return conn.execute(count).fetchone()[0] - before
 
 
 def get_channels():
     """Return all channels as a list of dicts."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT name, url, webhook_env FROM channels")
-    rows = c.fetchall()
-    conn.close()
+    rows = get_connection().execute("SELECT name, url, webhook_env FROM channels").fetchall()
     return [{"name": r[0], "url": r[1], "webhook_env": r[2]} for r in rows]
 
 
 def remove_channel(name):
-    """Remove a channel by name."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM channels WHERE name = ?", (name,))
-    conn.commit()
-    conn.close()
+    """Remove a channel by name, with its seen history."""
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            DELETE FROM seen_items
+            WHERE platform = 'youtube' AND channel IN (SELECT url FROM channels WHERE name = ?)
+        """, (name,))
+        conn.execute("DELETE FROM channels WHERE name = ?", (name,))
 
 
 def update_channel(name, new_name, new_url, new_webhook):
     """Update a channel's name, URL, or webhook."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    conn = get_connection()
 
-    if new_name:
-        c.execute("UPDATE channels SET name=? WHERE name=?", (new_name, name))
-        name = new_name
+    with conn:
+        if new_name:
+            conn.execute("UPDATE channels SET name=? WHERE name=?", (new_name, name))
+            name = new_name
 
-    if new_url:
-        c.execute("UPDATE channels SET url=? WHERE name=?", (new_url, name))
+        if new_url:
+            conn.execute("UPDATE channels SET url=? WHERE name=?", (new_url, name))
 
-    if new_webhook:
-        c.execute("UPDATE channels SET webhook_env=? WHERE name=?", (new_webhook, name))
+        if new_webhook:
+            conn.execute("UPDATE channels SET webhook_env=? WHERE name=?", (new_webhook, name))
 
-    conn.commit()
-    conn.close()
+
+def get_data_version():
+    """
+    PRAGMA data_version of this thread's connection. It changes whenever
+    another connection commits, so unchanged means nothing to reload.
+    """
+    return get_connection().execute("PRAGMA data_version").fetchone()[0]
+
+
+def get_config_version():
+    """Counter bumped on every change to the channels table."""
+    return get_connection().execute(
+        "SELECT version FROM config_version WHERE id = 0"
+    ).fetchone()[0]
 
 
 # ================= LAST SEEN =================
@@ -106,11 +307,9 @@ def get_last_seen(platform=None):
     If platform is provided, return only that platform's data.
     Otherwise, return all platforms.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT platform, channel_url, video_id FROM last_seen")
-    rows = c.fetchall()
-    conn.close()
+    rows = get_connection().execute(
+        "SELECT platform, channel_url, video_id FROM last_seen"
+    ).fetchall()
 
     data = {}
     for plat, url, vid in rows:
@@ -121,42 +320,489 @@ def get_last_seen(platform=None):
     return data  # Return all platforms
 
 
+def get_last_seen_many(channel_urls, platform="youtube"):
+    """Return {channel_url: video_id} for just the given channels."""
+    urls = list(channel_urls)
+    conn = get_connection()
+    data = {}
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        rows = conn.execute(f"""
+            SELECT channel_url, video_id FROM last_seen
+            WHERE platform = ? AND channel_url IN ({",".join("?" * len(chunk))})
+        """, (platform, *chunk)).fetchall()
+        data.update(rows)
+    return data
+
+
 def update_last_seen(channel_url, video_id, platform="youtube"):
     """Update the last seen video ID for a channel."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    update_last_seen_many([(channel_url, video_id)], platform=platform)
 
-    c.execute("""
-        INSERT OR REPLACE INTO last_seen (platform, channel_url, video_id)
-        VALUES (?, ?, ?)
-    """, (platform, channel_url, video_id))
 
-    conn.commit()
-    conn.close()
+def update_last_seen_many(items, platform="youtube"):
+    """
+    Update last seen video IDs for many channels in one transaction.
+    items is an iterable of (channel_url, video_id).
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO last_seen (platform, channel_url, video_id)
+            VALUES (?, ?, ?)
+        """, [(platform, url, vid) for url, vid in items])
+
 
 def get_last_seen_for_channel(channel_url, platform="youtube"):
     """
     Return the last seen video ID for a single channel.
     Returns None if no record exists.
     """
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    c.execute(
+    row = get_connection().execute(
         "SELECT video_id FROM last_seen WHERE platform=? AND channel_url=?",
         (platform, channel_url)
-    )
-
-    row = c.fetchone()
-    conn.close()
+    ).fetchone()
 
     return row[0] if row else None
 
 def channel_exists(url):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT 1 FROM channels WHERE url=?", (url,))
-    exists = c.fetchone() is not None
-    conn.close()
-    return exists
+    row = get_connection().execute("SELECT 1 FROM channels WHERE url=?", (url,)).fetchone()
+    return row is not None
+
+
+# ================= FEED CACHE =================
+
+def get_feed_validators():
+    """Return {channel_id: (etag, last_modified)} for all cached feeds."""
+    rows = get_connection().execute(
+        "SELECT channel_id, etag, last_modified FROM feed_cache"
+    ).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def update_feed_validators(channel_id, etag, last_modified):
+    """Store the validators from the latest 200 response for a feed."""
+    update_feed_validators_many([(channel_id, etag, last_modified)])
+
+
+def update_feed_validators_many(items):
+    """
+    Store feed validators for many channels in one transaction.
+    items is an iterable of (channel_id, etag, last_modified). Entries
+    with neither validator are removed.
+    """
+    items = list(items)
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO feed_cache (channel_id, etag, last_modified)
+            VALUES (?, ?, ?)
+        """, [i for i in items if i[1] or i[2]])
+        conn.executemany(
+            "DELETE FROM feed_cache WHERE channel_id=?",
+            [(i[0],) for i in items if not (i[1] or i[2])]
+        )
+
+
+# ================= CHANNEL IDS =================
+
+def get_channel_ids():
+    """Return {url: channel_id} for every resolved channel."""
+    rows = get_connection().execute("SELECT url, channel_id FROM channel_ids").fetchall()
+    return dict(rows)
+
+
+def save_channel_ids_many(items):
+    """
+    Store resolved channel IDs in one transaction.
+    items is an iterable of (url, channel_id).
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO channel_ids (url, channel_id) VALUES (?, ?)",
+            list(items)
+        )
+
+
+# ================= API QUOTA =================
+
+def get_quota_usage(day):
+    """Return YouTube Data API units spent on a quota day."""
+    row = get_connection().execute("SELECT units FROM api_quota WHERE day=?", (day,)).fetchone()
+    return row[0] if row else 0
+
+
+def add_quota_usage(day, units):
+    """Record units spent on a quota day."""
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT INTO api_quota (day, units) VALUES (?, ?)
+            ON CONFLICT(day) DO UPDATE SET units = units + excluded.units
+        """, (day, units))
+
+
+# ================= SEEN ITEMS =================
+
+def get_seen_items(channels, platform="youtube"):
+    """Return {channel: [item_id, ...]} oldest first, for just the given channels."""
+    channels = list(channels)
+    conn = get_connection()
+    data = {}
+    for i in range(0, len(channels), 500):
+        chunk = channels[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"""
+            SELECT channel, item_id FROM seen_items
+            WHERE platform = ? AND channel IN ({placeholders})
+            ORDER BY channel, first_seen_ts, item_id
+        """, (platform, *chunk)).fetchall()
+        for channel, item_id in rows:
+            data.setdefault(channel, []).append(item_id)
+    return data
+
+
+def compact_seen_items(keep, batch=1000):
+    """
+    Trim every channel's history to its newest keep items.
+    Deletes at most batch rows per transaction, so writers (the poll
+    cycle, WebSub pushes) are never blocked for long.
+    Returns the number of rows deleted.
+    """
+    conn = get_connection()
+    deleted = 0
+    while True:
+        with conn:
+            cursor = conn.execute("""
+                DELETE FROM seen_items WHERE (platform, channel, item_id) IN (
+                    SELECT platform, channel, item_id FROM (
+                        SELECT platform, channel, item_id, ROW_NUMBER() OVER (
+                            PARTITION BY platform, channel
+                            ORDER BY first_seen_ts DESC, item_id DESC
+                        ) AS rank
+                        FROM seen_items
+                    )
+                    WHERE rank > ?
+                    LIMIT ?
+                )
+            """, (keep, batch))
+        deleted += cursor.rowcount
+        if cursor.rowcount < batch:
+            return deleted
+
+
+# ================= OUTBOX =================
+
+def record_detections(detections, platform="youtube", seen=()):
+    """
+    Advance last_seen and enqueue notifications in one transaction, so a
+    crash can neither lose a detected video nor notify it twice.
+    detections is an iterable of
+    (channel_url, previous_video_id, video_id, notifications), where
+    notifications is a list of (webhook_env, embed dict).
+    seen is an iterable of (channel, item_id, first_seen_ts) rows added
+    to seen_items in the same transaction.
+
+    last_seen only moves if it still holds previous_video_id (None for a
+    first run). A detection another process recorded first is dropped
+    with its notifications, so replicas that briefly poll the same
+    channel during a shard rebalance cannot notify it twice.
+    Returns the number of notifications queued.
+    """
+    now = time.time()
+    queued = 0
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO seen_items (platform, channel, item_id, first_seen_ts)
+            VALUES (?, ?, ?, ?)
+        """, [(platform, channel, item_id, ts) for channel, item_id, ts in seen])
+
+        for url, previous, video_id, notifications in detections:
+            if previous is None:
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO last_seen (platform, channel_url, video_id)
+                    VALUES (?, ?, ?)
+                """, (platform, url, video_id))
+            else:
+                cursor = conn.execute("""
+                    UPDATE last_seen SET video_id = ?
+                    WHERE platform = ? AND channel_url = ? AND video_id = ?
+                """, (video_id, platform, url, previous))
+
+            if cursor.rowcount == 0:
+                continue
+
+            conn.executemany(
+                "INSERT INTO outbox (webhook_env, payload, created_at) VALUES (?, ?, ?)",
+                [(env, json.dumps(embed), now) for env, embed in notifications]
+            )
+            queued += len(notifications)
+    return queued
+
+
+def enqueue_notifications(notifications):
+    """Add (webhook_env, embed dict) pairs to the outbox in one transaction."""
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "INSERT INTO outbox (webhook_env, payload, created_at) VALUES (?, ?, ?)",
+            [(env, json.dumps(embed), now) for env, embed in notifications]
+        )
+
+
+def claim_outbox(limit):
+    """
+    Mark up to limit due rows as sending and return them, oldest first,
+    as a list of (id, webhook_env, embed dict).
+    """
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        # Take the write lock up front so two processes can't claim the same rows
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("""
+            SELECT id, webhook_env, payload FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id LIMIT ?
+        """, (now, limit)).fetchall()
+        conn.executemany(
+            "UPDATE outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+            [(now, r[0]) for r in rows]
+        )
+    return [(r[0], r[1], json.loads(r[2])) for r in rows]
+
+
+def release_outbox_claims(timeout):
+    """
+    Return rows claimed more than timeout seconds ago, and so abandoned by
+    a crashed process or a previous leader, to pending. Younger claims may
+    still be in flight and are left alone. Returns the number released.
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("""
+            UPDATE outbox SET status = 'pending'
+            WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at <= ?)
+        """, (time.time() - timeout,))
+    return cursor.rowcount
+
+
+def ack_outbox(ids):
+    """Delete delivered outbox rows."""
+    conn = get_connection()
+    with conn:
+        conn.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+
+
+def fail_outbox(ids, retry_delay, max_attempts):
+    """
+    Put failed rows back to pending after retry_delay seconds, or mark
+    them dead once they have been tried max_attempts times.
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            UPDATE outbox SET
+                attempts = attempts + 1,
+                next_attempt_at = ?,
+                status = CASE WHEN attempts + 1 >= ? THEN 'dead' ELSE 'pending' END
+            WHERE id = ?
+        """, [(time.time() + retry_delay, max_attempts, i) for i in ids])
+
+
+def reject_outbox(ids):
+    """Mark rows Discord refused as invalid dead without further attempts."""
+    conn = get_connection()
+    with conn:
+        conn.executemany(
+            "UPDATE outbox SET attempts = attempts + 1, status = 'dead' WHERE id = ?",
+            [(i,) for i in ids]
+        )
+
+
+def count_outbox(status="pending"):
+    """Number of outbox rows with a status."""
+    row = get_connection().execute(
+        "SELECT COUNT(*) FROM outbox WHERE status = ?", (status,)
+    ).fetchone()
+    return row[0]
+
+
+# ================= POLL SCHEDULE =================
+
+def get_poll_schedule(platform="youtube"):
+    """Return [(channel_url, next_due, mean_gap, last_upload, hours_json)]."""
+    return get_connection().execute("""
+        SELECT channel_url, next_due, mean_gap, last_upload, hours
+        FROM poll_schedule WHERE platform=?
+    """, (platform,)).fetchall()
+
+
+def save_poll_schedule_many(rows, platform="youtube"):
+    """
+    Store channel schedules in one transaction.
+    rows is an iterable of (channel_url, next_due, mean_gap, last_upload, hours_json).
+    """
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO poll_schedule
+                (platform, channel_url, next_due, mean_gap, last_upload, hours)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(platform, *row) for row in rows])
+
+
+# ================= WEBSUB =================
+
+def get_websub_leases():
+    """Return {channel_id: lease_expires} for verified subscriptions."""
+    rows = get_connection().execute(
+        "SELECT channel_id, lease_expires FROM websub_leases"
+    ).fetchall()
+    return dict(rows)
+
+
+def update_websub_lease(channel_id, lease_expires):
+    """Record a verified subscription lease."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO websub_leases (channel_id, lease_expires) VALUES (?, ?)",
+            (channel_id, lease_expires)
+        )
+
+
+# ================= SUBREDDITS =================
+
+def add_subreddit(name, webhook_env):
+    """Add a watched subreddit. Returns False if it already exists."""
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO subreddits (name, webhook_env) VALUES (?, ?)",
+                (name, webhook_env)
+            )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def get_subreddits():
+    """Return all watched subreddits as a list of dicts."""
+    rows = get_connection().execute("SELECT name, webhook_env FROM subreddits").fetchall()
+    return [{"name": r[0], "webhook_env": r[1]} for r in rows]
+
+
+def remove_subreddit(name):
+    """Remove a watched subreddit and its high-watermark. Returns False if it was not watched."""
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "DELETE FROM last_seen WHERE platform = 'reddit' AND channel_url = ?",
+            (name.lower(),)
+        )
+        cursor = conn.execute("DELETE FROM subreddits WHERE name = ?", (name,))
+    return cursor.rowcount > 0
+
+
+# ================= WEBSITES =================
+
+def add_website(name, url, webhook_env, selector=None):
+    """Add a watched page. Returns False if the name or URL already exists."""
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(
+                "INSERT INTO websites (name, url, selector, webhook_env) VALUES (?, ?, ?, ?)",
+                (name, url, selector, webhook_env)
+            )
+    except sqlite3.IntegrityError:
+        return False
+    return True
+
+
+def get_websites():
+    """Return all watched pages as a list of dicts."""
+    rows = get_connection().execute(
+        "SELECT name, url, selector, webhook_env FROM websites"
+    ).fetchall()
+    return [{"name": r[0], "url": r[1], "selector": r[2], "webhook_env": r[3]} for r in rows]
+
+
+def remove_website(name):
+    """Remove a watched page and its stored fingerprint."""
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            DELETE FROM website_state WHERE url IN (SELECT url FROM websites WHERE name = ?)
+        """, (name,))
+        conn.execute("DELETE FROM websites WHERE name = ?", (name,))
+
+
+def get_website_states():
+    """Return {url: (etag, last_modified, simhash_hex, packed_blocks)}."""
+    rows = get_connection().execute(
+        "SELECT url, etag, last_modified, simhash, blocks FROM website_state"
+    ).fetchall()
+    return {r[0]: r[1:] for r in rows}
+
+
+def record_website_checks(states, notifications):
+    """
+    Store page fingerprints and enqueue change notifications in one
+    transaction. states is an iterable of
+    (url, etag, last_modified, simhash_hex, packed_blocks, checked_at, changed_at);
+    changed_at None keeps the previous value.
+    """
+    now = time.time()
+    conn = get_connection()
+    with conn:
+        conn.executemany("""
+            INSERT INTO website_state
+                (url, etag, last_modified, simhash, blocks, checked_at, changed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                simhash = excluded.simhash,
+                blocks = excluded.blocks,
+                checked_at = excluded.checked_at,
+                changed_at = COALESCE(excluded.changed_at, website_state.changed_at)
+        """, list(states))
+        conn.executemany(
+            "INSERT INTO outbox (webhook_env, payload, created_at) VALUES (?, ?, ?)",
+            [(env, json.dumps(embed), now) for env, embed in notifications]
+        )
+
+
+# ================= WORKERS =================
+
+def heartbeat_worker(worker_id, now, ttl):
+    """Register or refresh a replica and forget replicas silent for ttl seconds."""
+    conn = get_connection()
+    with conn:
+        conn.execute("""
+            INSERT INTO workers (worker_id, joined_at, heartbeat) VALUES (?, ?, ?)
+            ON CONFLICT(worker_id) DO UPDATE SET heartbeat = excluded.heartbeat
+        """, (worker_id, now, now))
+        conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - ttl,))
+
+
+def get_live_workers(now, ttl):
+    """Return IDs of replicas seen within ttl seconds, oldest member first."""
+    rows = get_connection().execute(
+        "SELECT worker_id FROM workers WHERE heartbeat >= ? ORDER BY joined_at, worker_id",
+        (now - ttl,)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def remove_worker(worker_id):
+    """Deregister a replica on clean shutdown."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
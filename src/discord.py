@@ -3,50 +3,59 @@ discord.py
 Handles sending messages to Discord using webhooks.
 """
 
-import requests
 import logging
 from datetime import datetime
 
+from dispatcher import dispatcher
+from metrics import NOTIFICATIONS_QUEUED
+
 logger = logging.getLogger("discord_monitor.discord")
 
 
-def send_discord_notification(title, channel_name, video_id, webhook_url, thumbnail_url=None):
-    """
-    Send a Discord embed notification to a specific webhook.
-    Reusable for YouTube, Reddit, Websites, etc.
-    """
+def build_link_embed(title, url, description, color=0x5865F2, image_url=None):
+    """Build a Discord embed linking to any URL (videos, pages, posts)."""
+    embed = {
+        "title": title[:256],
+        "url": url,
+        "description": description[:4096],
+        "color": color,
+        "timestamp": datetime.utcnow().isoformat(),
+        "footer": {"text": "Discord Monitor Bot"}
+    }
+    if image_url:
+        embed["image"] = {"url": image_url}
+    return embed
 
-    if not webhook_url:
-        logger.error("Webhook URL not provided")
-        return
 
+def build_embed(title, channel_name, video_id, thumbnail_url=None):
+    """Build the Discord embed for a new video."""
     video_url = f"https://youtu.be/{video_id}"
 
     # Fallback thumbnail if missing
     if not thumbnail_url:
         thumbnail_url = f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
 
-    embed = {
-        "title": title,
-        "url": video_url,
-        "description": f"📺 New video from **{channel_name}**",
-        "color": 0xFF0000,
-        "timestamp": datetime.utcnow().isoformat(),
-        "image": {"url": thumbnail_url},
-        "footer": {"text": "Discord Monitor Bot"}
-    }
+    return build_link_embed(
+        title, video_url, f"📺 New video from **{channel_name}**",
+        color=0xFF0000, image_url=thumbnail_url,
+    )
 
-    payload = {"embeds": [embed]}
 
-    try:
-        response = requests.post(webhook_url, json=payload, timeout=10)
+def send_discord_notification(title, channel_name, video_id, webhook_url, thumbnail_url=None,
+                              on_done=None):
+    """
+    Queue a Discord embed notification for a specific webhook.
+    Returns immediately; the dispatcher delivers it in the background,
+    respecting Discord rate limits. on_done(outcome) is called once the
+    message is delivered or given up on (see dispatcher.enqueue).
+    Reusable for YouTube, Reddit, Websites, etc.
+    """
 
-        if response.status_code == 204:
-            logger.info(f"Discord notification sent for {channel_name}")
-        elif response.status_code == 429:
-            logger.warning("Discord rate limited (429). Consider increasing interval.")
-        else:
-            logger.error(f"Discord error {response.status_code}: {response.text}")
+    if not webhook_url:
+        logger.error("Webhook URL not provided")
+        return
 
-    except Exception as e:
-        logger.exception(f"Discord webhook request failed: {e}")
+    embed = build_embed(title, channel_name, video_id, thumbnail_url)
+    dispatcher.enqueue(webhook_url, embed, on_done=on_done)
+    NOTIFICATIONS_QUEUED.inc()
+    logger.info(f"Discord notification queued for {channel_name}")
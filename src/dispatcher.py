@@ -0,0 +1,272 @@
+"""
+dispatcher.py
+
+Rate-limit-aware Discord webhook dispatcher.
+Queues outbound embeds per webhook and sends them from background
+workers, honoring Discord's X-RateLimit-* and Retry-After headers.
+Embeds queued for the same webhook are packed up to 10 per request.
+Different webhooks are sent to in parallel; callers never block.
+"""
+
+import os
+import time
+import logging
+from collections import deque
+from threading import Lock, Condition, BoundedSemaphore, Thread
+from dotenv import load_dotenv
+
+import http_client
+from metrics import (
+    WEBHOOK_SEND_SECONDS, WEBHOOK_RESULTS, DISCORD_RATE_LIMITED, DISPATCHER_QUEUE_DEPTH
+)
+
+load_dotenv()
+
+# Max webhook requests in flight across all webhooks
+DISCORD_MAX_PARALLEL = int(os.getenv("DISCORD_MAX_PARALLEL", 4))
+
+# Attempts per message on network errors / 5xx before giving up
+DISCORD_MAX_RETRIES = int(os.getenv("DISCORD_MAX_RETRIES", 5))
+
+# Exponential backoff (seconds) between failed attempts
+DISCORD_BACKOFF_BASE = float(os.getenv("DISCORD_BACKOFF_BASE", 1.0))
+DISCORD_BACKOFF_MAX = float(os.getenv("DISCORD_BACKOFF_MAX", 60.0))
+
+# Seconds to hold the first queued embed so others can join its request
+DISCORD_BATCH_WINDOW = float(os.getenv("DISCORD_BATCH_WINDOW", 2.0))
+
+# Discord limits per message
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS_PER_MESSAGE = 6000
+
+logger = logging.getLogger("discord_monitor.dispatcher")
+
+# Send outcomes
+SENT = "sent"
+RATE_LIMITED = "rate_limited"
+FAILED = "failed"
+REJECTED = "rejected"
+
+
+class _WebhookQueue:
+    """Pending embeds and rate-limit bucket state for one webhook."""
+
+    def __init__(self, url):
+        self.url = url
+        self.items = deque()  # [embed, on_done, attempts, queued_at, alone]
+        self.remaining = None  # requests left in the current window
+        self.reset_at = 0.0  # monotonic time the bucket refills
+        self.retry_at = 0.0  # monotonic time a 429 / backoff hold ends
+        self.worker = None
+
+
+class Dispatcher:
+    """
+    Per-webhook queues drained by on-demand worker threads.
+
+    Each webhook's bucket is tracked from the response headers: once
+    X-RateLimit-Remaining hits zero the worker waits for
+    X-RateLimit-Reset-After, and a 429 pauses the bucket (or every
+    bucket, for global limits) for Retry-After without dropping the
+    message. Network errors and 5xx retry with exponential backoff.
+    If Discord rejects a batch (4xx), its embeds are resent one per
+    request so only the bad one is dropped.
+    """
+
+    def __init__(self, max_parallel=DISCORD_MAX_PARALLEL, max_retries=DISCORD_MAX_RETRIES,
+                 batch_window=DISCORD_BATCH_WINDOW):
+        self.max_retries = max_retries
+        self.batch_window = batch_window
+        self._lock = Lock()
+        self._idle = Condition(self._lock)
+        self._queues = {}
+        self._parallel = BoundedSemaphore(max_parallel)
+        self._global_reset_at = 0.0
+
+    def enqueue(self, webhook_url, embed, on_done=None):
+        """
+        Queue an embed for a webhook and return immediately.
+        on_done(outcome) is called from the worker once the message is
+        delivered (SENT), given up on after retries (FAILED) or refused by
+        Discord as invalid (REJECTED).
+        """
+        with self._lock:
+            queue = self._queues.get(webhook_url)
+            if queue is None:
+                queue = self._queues[webhook_url] = _WebhookQueue(webhook_url)
+            queue.items.append([embed, on_done, 0, time.monotonic(), False])
+
+            if queue.worker is None:
+                queue.worker = Thread(
+                    target=self._run, args=(queue,), name="discord-webhook", daemon=True
+                )
+                queue.worker.start()
+
+    def pending(self):
+        """Number of embeds waiting across all webhooks."""
+        with self._lock:
+            return sum(len(q.items) for q in self._queues.values())
+
+    def flush(self, timeout=None):
+        """Block until every queue is drained. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            while any(q.worker is not None for q in self._queues.values()):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    # ================= WORKER =================
+
+    def _run(self, queue):
+        while True:
+            with self._lock:
+                if not queue.items:
+                    queue.worker = None
+                    del self._queues[queue.url]
+                    self._idle.notify_all()
+                    return
+                first_queued_at = queue.items[0][3]
+                full = len(queue.items) >= MAX_EMBEDS_PER_MESSAGE
+
+            # Give embeds from the same cycle a moment to join this request
+            hold = first_queued_at + self.batch_window - time.monotonic()
+            if not full and hold > 0:
+                time.sleep(hold)
+
+            self._wait_for_bucket(queue)
+
+            with self._lock:
+                batch = _take_batch(queue.items)
+
+            with self._parallel:
+                outcome = self._send(queue, [item[0] for item in batch])
+
+            if outcome == RATE_LIMITED:
+                continue
+
+            # One bad embed fails the whole request: retry the batch one by one
+            if outcome == REJECTED and len(batch) > 1:
+                logger.warning(f"Discord rejected a batch of {len(batch)} embeds, resending them separately")
+                for item in batch:
+                    item[4] = True
+                continue
+
+            if outcome == FAILED:
+                for item in batch:
+                    item[2] += 1
+                attempts = batch[0][2]
+                if attempts < self.max_retries:
+                    delay = min(DISCORD_BACKOFF_BASE * 2 ** (attempts - 1), DISCORD_BACKOFF_MAX)
+                    logger.warning(f"Retrying Discord webhook in {delay:.1f}s (attempt {attempts})")
+                    queue.retry_at = time.monotonic() + delay
+                    continue
+                logger.error(f"Giving up on {len(batch)} Discord embeds after {attempts} attempts")
+
+            with self._lock:
+                for _ in batch:
+                    queue.items.popleft()
+
+            for item in batch:
+                if item[1]:
+                    try:
+                        item[1](outcome)
+                    except Exception as e:
+                        logger.exception(f"Discord delivery callback failed: {e}")
+
+    def _wait_for_bucket(self, queue):
+        """Sleep until this webhook's bucket (and the global limit) allow a request."""
+        now = time.monotonic()
+        wait_until = max(self._global_reset_at, queue.retry_at)
+        if queue.remaining == 0:
+            wait_until = max(wait_until, queue.reset_at)
+        if wait_until > now:
+            time.sleep(wait_until - now)
+            queue.remaining = None
+
+    def _send(self, queue, embeds):
+        """POST embeds to the webhook and update its bucket from the response."""
+        outcome = self._post(queue, embeds)
+        WEBHOOK_RESULTS.inc(result=outcome)
+        return outcome
+
+    def _post(self, queue, embeds):
+        try:
+            with WEBHOOK_SEND_SECONDS.time():
+                response = http_client.post(queue.url, json={"embeds": embeds})
+        except Exception as e:
+            logger.warning(f"Discord webhook request failed: {e}")
+            return FAILED
+
+        now = time.monotonic()
+        headers = response.headers
+
+        if "X-RateLimit-Remaining" in headers:
+            queue.remaining = int(headers["X-RateLimit-Remaining"])
+        if "X-RateLimit-Reset-After" in headers:
+            queue.reset_at = now + float(headers["X-RateLimit-Reset-After"])
+
+        if response.status_code in (200, 204):
+            return SENT
+
+        if response.status_code == 429:
+            retry_after = _retry_after(response)
+            is_global = headers.get("X-RateLimit-Global") or headers.get("X-RateLimit-Scope") == "global"
+            DISCORD_RATE_LIMITED.inc(scope="global" if is_global else "webhook")
+            if is_global:
+                self._global_reset_at = now + retry_after
+                logger.warning(f"Discord global rate limit, pausing all webhooks {retry_after:.1f}s")
+            else:
+                queue.retry_at = now + retry_after
+                logger.warning(f"Discord rate limited (429), retrying in {retry_after:.1f}s")
+            return RATE_LIMITED
+
+        if response.status_code >= 500:
+            logger.warning(f"Discord error {response.status_code}")
+            return FAILED
+
+        logger.error(f"Discord error {response.status_code}: {response.text}")
+        return REJECTED
+
+
+def _embed_chars(embed):
+    """Characters Discord counts toward the per-message embed limit."""
+    return (
+        len(embed.get("title", ""))
+        + len(embed.get("description", ""))
+        + len(embed.get("footer", {}).get("text", ""))
+        + len(embed.get("author", {}).get("name", ""))
+        + sum(len(f.get("name", "")) + len(f.get("value", "")) for f in embed.get("fields", []))
+    )
+
+
+def _take_batch(items):
+    """
+    Return the leading queue items that fit in one webhook message.
+    Items from a rejected batch are sent alone.
+    """
+    batch = []
+    chars = 0
+    for item in items:
+        size = _embed_chars(item[0])
+        if batch and (item[4] or batch[0][4] or len(batch) >= MAX_EMBEDS_PER_MESSAGE
+                      or chars + size > MAX_EMBED_CHARS_PER_MESSAGE):
+            break
+        batch.append(item)
+        chars += size
+    return batch
+
+
+def _retry_after(response):
+    """Seconds to wait after a 429, from the JSON body or Retry-After header."""
+    try:
+        return float(response.json()["retry_after"])
+    except Exception:
+        return float(response.headers.get("Retry-After", 1))
+
+
+# Shared dispatcher for the whole bot
+dispatcher = Dispatcher()
+DISPATCHER_QUEUE_DEPTH.callback = dispatcher.pending
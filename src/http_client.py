@@ -0,0 +1,107 @@
+"""
+http_client.py
+
+Shared HTTP session for all outbound requests.
+Keeps connections alive per host so feeds, webhooks and API calls
+reuse TCP+TLS sessions instead of handshaking every request.
+"""
+
+import os
+import logging
+import requests
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+
+from metrics import HTTP_REQUEST_SECONDS, HTTP_RESPONSES
+from circuit import check_host, breaker_for
+
+load_dotenv()
+
+# Connection pool sizing (pools per host / sockets kept per host)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 10))
+
+# Default timeout in seconds (connect, read)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+
+# Retries for idempotent requests on connection errors and 5xx
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", 0.5))
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+logger = logging.getLogger("discord_monitor.http")
+
+
+def _accept_encoding():
+    """Advertise brotli only if urllib3 can decode it."""
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        return "gzip, deflate"
+
+
+def _build_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.headers["Accept-Encoding"] = _accept_encoding()
+
+    # Only GETs are retried here. POSTs (webhooks) must not be replayed
+    # blindly or Discord gets duplicate messages.
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared by every module and worker thread (urllib3 pools are thread-safe)
+session = _build_session()
+
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the shared session with the default timeout.
+    Raises circuit.CircuitOpenError without sending if the host's circuit
+    is open; connection errors and 5xx responses count against it.
+    """
+    kwargs.setdefault("timeout", HTTP_TIMEOUT)
+    host = urlparse(url).hostname or ""
+    check_host(host)
+
+    with HTTP_REQUEST_SECONDS.time(host=host, method=method):
+        try:
+            response = session.request(method, url, **kwargs)
+        except Exception:
+            HTTP_RESPONSES.inc(host=host, status="error")
+            breaker_for(host).record(False)
+            raise
+
+    HTTP_RESPONSES.inc(host=host, status=response.status_code)
+    breaker_for(host).record(response.status_code < 500)
+    return response
+
+
+def get(url, **kwargs):
+    """GET through the shared session with the default timeout."""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST through the shared session with the default timeout."""
+    return request("POST", url, **kwargs)
@@ -2,30 +2,156 @@
 logging_config.py
 
 Central logging configuration for Discord Monitor Bot.
+
+Log calls only put records on a queue; a background listener thread
+does the formatting and the file/console I/O, so the polling loop never
+waits on a disk or a terminal. Repetitive per-channel messages are
+rate-limited per call site before they are queued.
 """
 
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import time
+import atexit
+import queue
+from threading import Lock
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from dotenv import load_dotenv
+
+from metrics import LOG_RECORDS_DROPPED
+
+load_dotenv()
 
 # Base directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 LOG_DIR = os.path.join(BASE_DIR, "logs")
 LOG_FILE = os.path.join(LOG_DIR, "bot.log")
 
+# Lowest level logged anywhere (DEBUG records are not even created above it)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# "text" for human-readable lines, "json" for one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+# Records waiting for the writer thread; past this, new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+# Each %-style call site may log this many records per window (0 = no limit).
+# CRITICAL records and records carrying a traceback are never limited.
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 50))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", 60))
+
 # Ensure logs directory exists
 os.makedirs(LOG_DIR, exist_ok=True)
 
+_listener = None
+_exception_formatter = logging.Formatter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `limit` records per call site (logger, message template)
+    through per window, at any level below CRITICAL, so a warning or
+    error repeated for every channel on every cycle is sampled too.
+    Only lazy %-style calls have a stable template, so records without
+    args (f-strings) always pass, as do records carrying a traceback.
+    Dropped records are never formatted or queued; the first record of
+    the next window reports how many were suppressed.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, window=LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._sites = {}  # (name, msg) -> [window start, count, suppressed]
+        self._lock = Lock()
+
+    def filter(self, record):
+        if (self.limit <= 0 or not record.args or record.exc_info
+                or record.levelno >= logging.CRITICAL):
+            return True
+
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [now, 1, 0]
+            elif site[1] < self.limit:
+                site[1] += 1
+                return True
+            else:
+                site[2] += 1
+                return False
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} [{suppressed} similar suppressed]"
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def prepare(self, record):
+        # Resolve args and tracebacks now (they may change or hold frames),
+        # but leave the layout to the listener's formatter
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def _build_formatter():
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s | %(levelname)s | %(name)s | %(message)s")
+
 
 def setup_logging():
     """Configure global logging."""
+    global _listener
+
     logger = logging.getLogger("discord_monitor")
-    logger.setLevel(logging.DEBUG)
 
-    # Formatter
-    formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
-    )
+    # Avoid duplicate handlers
+    if logger.handlers:
+        return logger
+
+    logger.setLevel(LOG_LEVEL)
+    formatter = _build_formatter()
 
     # Rotating file handler (10MB x 5 backups)
     file_handler = RotatingFileHandler(LOG_FILE, maxBytes=10 * 1024 * 1024, backupCount=5)
@@ -37,9 +163,24 @@ def setup_logging():
     console_handler.setFormatter(formatter)
     console_handler.setLevel(logging.DEBUG)
 
-    # Avoid duplicate handlers
-    if not logger.handlers:
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
+    # Callers only enqueue; the listener thread formats and writes
+    queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    queue_handler.addFilter(RateLimitFilter())
+    logger.addHandler(queue_handler)
+
+    _listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
+    # Flush what is still queued when the process exits
+    atexit.register(stop_logging)
 
     return logger
+
+
+def stop_logging():
+    """Write out queued records and stop the writer thread."""
+    global _listener
+
+    listener, _listener = _listener, None
+    if listener:
+        listener.stop()
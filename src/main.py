@@ -2,7 +2,7 @@
 main.py
 
 Main scheduler for the Discord Monitor Bot.
-This file ONLY controls timing and calls monitor modules.
+This file ONLY registers monitor modules and drives the module runtime.
 """
 
 import time
@@ -21,22 +21,59 @@ init_db()
 logger = setup_logging()
 
 # ================= IMPORT MONITOR MODULES =================
-from monitor_youtube import check_youtube
-# from monitor_reddit import check_reddit
-# from monitor_websites import check_websites
+from monitor_youtube import check_youtube, youtube_scheduler, handle_pushed_entries
+from websub import WEBSUB_ENABLED, WebSubService
+from metrics import start_metrics_server, CHECK_INTERVAL_SECONDS
+from poller import MAX_IN_FLIGHT
+from runtime import runtime
+from dispatcher import dispatcher
+from outbox import outbox_worker
+from sharding import shard
+from config import config_watcher
+from seen import compact as compact_seen
+from monitor_reddit import check_reddit
+from monitor_websites import check_websites
 
 # ================= LOAD ENV VARIABLES =================
 load_dotenv()
 
-# Check interval in seconds (default 5 minutes)
+# Check interval in seconds (default 5 minutes).
+# With adaptive polling this is the longest gap between YouTube runs.
 CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 300))
 
-# Active monitor modules
-MONITOR_MODULES = [
-    check_youtube,
-    # check_reddit,
-    # check_websites
-]
+# A module run longer than this is reported and skips the work it has not started (seconds)
+YOUTUBE_TIMEOUT = int(os.getenv("YOUTUBE_TIMEOUT", 240))
+
+# Reddit checks: interval, parallel listing requests and timeout (seconds)
+REDDIT_INTERVAL = int(os.getenv("REDDIT_INTERVAL", 300))
+REDDIT_CONCURRENCY = int(os.getenv("REDDIT_CONCURRENCY", 2))
+REDDIT_TIMEOUT = int(os.getenv("REDDIT_TIMEOUT", 120))
+
+# Website change checks: interval, parallel page fetches and timeout (seconds)
+WEBSITES_INTERVAL = int(os.getenv("WEBSITES_INTERVAL", 900))
+WEBSITES_CONCURRENCY = int(os.getenv("WEBSITES_CONCURRENCY", 5))
+WEBSITES_TIMEOUT = int(os.getenv("WEBSITES_TIMEOUT", 300))
+
+# How often stored seen history is trimmed to its per-channel cap (seconds)
+SEEN_COMPACT_INTERVAL = int(os.getenv("SEEN_COMPACT_INTERVAL", 3600))
+
+# Seconds to wait for queued Discord messages on shutdown
+SHUTDOWN_FLUSH_TIMEOUT = int(os.getenv("SHUTDOWN_FLUSH_TIMEOUT", 30))
+
+# Active monitor modules, each on its own interval, run in parallel
+runtime.register(
+    "youtube", check_youtube, interval=CHECK_INTERVAL, concurrency=MAX_IN_FLIGHT,
+    timeout=YOUTUBE_TIMEOUT, next_due=youtube_scheduler.next_due,
+)
+runtime.register(
+    "reddit", check_reddit, interval=REDDIT_INTERVAL,
+    concurrency=REDDIT_CONCURRENCY, timeout=REDDIT_TIMEOUT,
+)
+runtime.register(
+    "websites", check_websites, interval=WEBSITES_INTERVAL,
+    concurrency=WEBSITES_CONCURRENCY, timeout=WEBSITES_TIMEOUT,
+)
+runtime.register("seen-compaction", compact_seen, interval=SEEN_COMPACT_INTERVAL, timeout=300)
 
 # Shutdown flag
 shutdown_requested = False
@@ -53,20 +90,6 @@ signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
 
-def run_cycle():
-    """Run a single monitoring cycle."""
-    logger.info("===== Monitoring cycle started =====")
-
-    for module_func in MONITOR_MODULES:
-        try:
-            logger.info(f"Running module: {module_func.__name__}")
-            module_func()
-        except Exception as e:
-            logger.exception(f"Module {module_func.__name__} failed: {e}")
-
-    logger.info("===== Monitoring cycle finished =====")
-
-
 def main():
     """Main infinite scheduler loop."""
     logger.info("======================================")
@@ -74,16 +97,53 @@ def main():
     logger.info("======================================")
     logger.info(f"Check interval: {CHECK_INTERVAL} seconds")
 
-    while not shutdown_requested:
-        run_cycle()
+    # Optional Prometheus exporter (METRICS_PORT)
+    CHECK_INTERVAL_SECONDS.set(CHECK_INTERVAL)
+    start_metrics_server()
+
+    # Join the shard before the first cycle so ownership is known
+    shard.start()
 
-        logger.info(f"Sleeping for {CHECK_INTERVAL} seconds...")
+    # Start delivering queued notifications (including any left by a crash)
+    outbox_worker.start()
 
-        # Sleep in small chunks to allow graceful shutdown
-        for _ in range(CHECK_INTERVAL):
-            if shutdown_requested:
-                break
-            time.sleep(1)
+    # Optional WebSub push ingest
+    websub_service = None
+    if WEBSUB_ENABLED:
+        websub_service = WebSubService(on_entries=handle_pushed_entries)
+        websub_service.start()
+
+    # Each tick starts due modules; sleeping in 1s steps allows graceful shutdown
+    shard_generation = shard.generation
+    while not shutdown_requested:
+        runtime.run_due()
+        time.sleep(1)
+
+        # Edited channels or webhooks are picked up right away
+        if config_watcher.poll():
+            logger.info("Configuration changed, running modules now")
+            runtime.expedite()
+
+        # Channels inherited from a replica that left are polled right away
+        if shard.generation != shard_generation:
+            shard_generation = shard.generation
+            logger.info("Shard membership changed, running modules now")
+            runtime.expedite()
+
+    # Let running modules record what they found
+    runtime.shutdown(timeout=SHUTDOWN_FLUSH_TIMEOUT)
+
+    if websub_service:
+        websub_service.stop()
+
+    # Deliver anything already handed to Discord; the rest stays in the outbox
+    outbox_worker.stop(timeout=5)
+    if not dispatcher.flush(timeout=SHUTDOWN_FLUSH_TIMEOUT):
+        logger.warning(f"{dispatcher.pending()} Discord messages still queued at shutdown")
+    outbox_worker.record_outcomes()
+
+    # Hand this replica's channels to the others immediately
+    shard.stop()
 
     logger.info("Bot stopped cleanly.")
     sys.exit(0)
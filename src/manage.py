@@ -2,13 +2,35 @@
 manage.py
 
 CLI tool to manage monitored channels in SQLite + auto .env webhook storage
+
+Interactive:      python manage.py
+Non-interactive:  python manage.py import channels.csv --concurrency 20
+                  python manage.py export -o snapshot.json
+                  python manage.py bootstrap --concurrency 20
+                  python manage.py add-subreddit buildapcsales --webhook-env REDDIT_BUILDAPCSALES_WEBHOOK
+                  python manage.py add-website "Changelog" https://example.com/changelog \
+                      --webhook-env SITE_CHANGELOG_WEBHOOK --selector main
 """
 
 import os
+import sys
+import csv
+import json
 import logging
-from db import init_db, add_channel, get_channels, remove_channel, update_channel, update_last_seen
-from channel_cache import resolve_channel_id
-from youtube import get_latest_video
+import argparse
+from threading import Lock
+from urllib.parse import urlparse, parse_qs
+from xml.etree import ElementTree
+
+from db import (
+    init_db, add_channel, add_channels_many, get_channels, remove_channel, update_channel,
+    get_last_seen, update_last_seen_many, add_website, get_websites, remove_website,
+    add_subreddit, get_subreddits, remove_subreddit
+)
+from channel_cache import resolve_channel_ids, flush_cache, load_cache, seed_cache
+from youtube import fetch_feed, FEED_HOST
+from poller import poll_all
+from website import parse_selector
 from logging_config import setup_logging
 
 # ================= INIT =================
@@ -24,30 +46,37 @@ ENV_FILE = os.path.join(BASE_DIR, ".env")
 
 def save_webhook_to_env(key, url):
     """Safely add or update a webhook key in .env using atomic write"""
+    save_webhooks_to_env({key: url})
+    print(f"✅ Saved {key} to .env")
+
+
+def save_webhooks_to_env(webhooks):
+    """Add or update many webhook keys in .env with a single atomic write"""
+    if not webhooks:
+        return
 
     os.makedirs(os.path.dirname(ENV_FILE), exist_ok=True)
 
     lines = []
-    found = False
-
     if os.path.exists(ENV_FILE):
         with open(ENV_FILE, "r") as f:
             lines = f.readlines()
 
-    # Prevent duplicate keys
-    for line in lines:
-        if line.strip().startswith(f"{key}="):
-            found = True
-
+    # Replace existing keys in place
     new_lines = []
+    written = set()
     for line in lines:
-        if line.strip().startswith(f"{key}="):
-            new_lines.append(f"{key}={url}\n")
+        key = line.strip().split("=", 1)[0]
+        if key in webhooks:
+            new_lines.append(f"{key}={webhooks[key]}\n")
+            written.add(key)
         else:
             new_lines.append(line)
 
-    if not found:
-        new_lines.append(f"\n{key}={url}\n")
+    missing = [key for key in webhooks if key not in written]
+    if missing:
+        new_lines.append("\n")
+        new_lines.extend(f"{key}={webhooks[key]}\n" for key in missing)
 
     temp_file = ENV_FILE + ".tmp"
     with open(temp_file, "w") as f:
@@ -55,8 +84,7 @@ def save_webhook_to_env(key, url):
 
     os.replace(temp_file, ENV_FILE)
 
-    logger.info(f"Saved webhook {key} to .env")
-    print(f"✅ Saved {key} to .env")
+    logger.info(f"Saved {len(webhooks)} webhook(s) to .env")
 
 
 # ================= CLI COMMANDS =================
@@ -144,39 +172,259 @@ def edit():
     print(f"✏ Updated {name}")
 
 
-def bootstrap():
+def bootstrap(channels=None, concurrency=10):
     """
     Pre-cache latest videos for all channels (no Discord spam).
-    Run this after adding many channels.
+    Run this after adding many channels. Channel IDs are resolved in
+    bulk and feeds are fetched concurrently.
     """
     print("\n=== Bootstrapping Last Seen Cache ===")
 
-    channels = get_channels()
+    channels = get_channels() if channels is None else channels
+    if not channels:
+        print("No channels to bootstrap.")
+        return
+
+    channel_ids = resolve_channel_ids([c["url"] for c in channels])
+    jobs = []
     for c in channels:
-        name = c["name"]
-        url = c["url"]
+        if channel_ids.get(c["url"]):
+            jobs.append((c, channel_ids[c["url"]]))
+        else:
+            print(f"❌ Failed to resolve {c['name']}")
+
+    progress = {"done": 0, "failed": 0}
+    progress_lock = Lock()
+
+    def fetch(job):
+        channel, channel_id = job
+        feed = fetch_feed(channel_id)
+        with progress_lock:
+            progress["done"] += 1
+            progress["failed"] += not feed["entries"]
+            print(f"\r  fetched {progress['done']}/{len(jobs)} feeds ({progress['failed']} failed)",
+                  end="", file=sys.stderr, flush=True)
+        return feed
+
+    results = poll_all(jobs, fetch=fetch, host_of=lambda job: FEED_HOST,
+                       max_workers=concurrency, per_host=concurrency)
+    if jobs:
+        print(file=sys.stderr)
+
+    updates = []
+    for (c, _), feed, error in results:
+        video_id, title, _ = feed["video"] if feed else (None, None, None)
+        if not video_id:
+            print(f"❌ No video found for {c['name']}")
+            continue
+        updates.append((c["url"], video_id))
+        logger.debug(f"Cached latest video for {c['name']}: {title}")
 
-        print(f"Bootstrapping {name}...")
+    # One transaction for every channel
+    update_last_seen_many(updates, platform="youtube")
+    flush_cache()
+    print(f"✅ Bootstrap complete: {len(updates)}/{len(channels)} channels cached. No notifications were sent.")
 
-        channel_id = resolve_channel_id(url)
-        if not channel_id:
-            print(f"❌ Failed to resolve {name}")
-            continue
 
-        video_id, title, _ = get_latest_video(channel_id)
-        if not video_id:
-            print(f"❌ No video found for {name}")
+# ================= IMPORT / EXPORT =================
+
+def _channel_url_from_feed(feed_url):
+    """https://www.youtube.com/feeds/videos.xml?channel_id=UC... → channel URL."""
+    channel_id = parse_qs(urlparse(feed_url).query).get("channel_id", [None])[0]
+    return f"https://www.youtube.com/channel/{channel_id}" if channel_id else None
+
+
+def read_channels_file(path, fmt=None, webhook_env=None, webhook_url=None):
+    """
+    Read channels from CSV, JSON or OPML.
+    CSV/JSON rows have name, url, webhook_env and optionally webhook_url;
+    JSON may also be a snapshot written by export. OPML (e.g. a YouTube
+    subscriptions export) has no webhooks, so webhook_env is required.
+    Returns (channels, webhooks, last_seen).
+    """
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    rows, webhooks, last_seen = [], {}, {}
+
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    elif fmt == "json":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            rows = data.get("channels", [])
+            webhooks = data.get("webhooks", {})
+            last_seen = data.get("last_seen", {})
+        else:
+            rows = data
+    elif fmt in ("opml", "xml"):
+        for outline in ElementTree.parse(path).iter("outline"):
+            url = _channel_url_from_feed(outline.get("xmlUrl", ""))
+            if url:
+                rows.append({"name": outline.get("title") or outline.get("text"), "url": url})
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    channels = []
+    for row in rows:
+        name = (row.get("name") or "").strip()
+        url = (row.get("url") or "").strip()
+        env = (row.get("webhook_env") or webhook_env or "").strip()
+        if not name or not url or not env:
+            print(f"[WARN] Skipping incomplete row: {row}")
             continue
+        channels.append({"name": name, "url": url, "webhook_env": env,
+                         "channel_id": row.get("channel_id")})
+        if row.get("webhook_url"):
+            webhooks[env] = row["webhook_url"].strip()
+
+    if webhook_env and webhook_url:
+        webhooks[webhook_env] = webhook_url
+
+    return channels, webhooks, last_seen
+
+
+def import_channels(path, fmt=None, webhook_env=None, webhook_url=None, concurrency=10, run_bootstrap=True):
+    """Bulk-add channels from a file, then bootstrap the ones without a cached video."""
+    channels, webhooks, last_seen = read_channels_file(path, fmt, webhook_env, webhook_url)
+    print(f"Read {len(channels)} channels from {path}")
+
+    # Resolve every channel ID up front (cached, deduplicated, concurrent);
+    # IDs carried in a snapshot skip the API entirely
+    seed_cache((c["url"], c["channel_id"]) for c in channels)
+    resolved = resolve_channel_ids([c["url"] for c in channels])
+    unresolved = [c for c in channels if not resolved.get(c["url"])]
+    for c in unresolved:
+        print(f"❌ Could not resolve {c['name']} ({c['url']}), skipped")
+    channels = [c for c in channels if resolved.get(c["url"])]
+
+    missing = {c["webhook_env"] for c in channels} - set(webhooks) - set(os.environ)
+    for env in sorted(missing):
+        print(f"[WARN] Webhook ENV '{env}' is not set; add it to .env before running the bot")
+
+    save_webhooks_to_env(webhooks)
+    added = add_channels_many((c["name"], c["url"], c["webhook_env"]) for c in channels)
+    print(f"✅ Added {added} channels ({len(channels) - added} already existed)")
+
+    # Snapshots carry last_seen, so restored channels don't need a fetch
+    known = {url: vid for url, vid in last_seen.items() if resolved.get(url)}
+    update_last_seen_many(known.items(), platform="youtube")
+
+    if run_bootstrap:
+        cached = get_last_seen("youtube")
+        bootstrap([c for c in channels if c["url"] not in cached], concurrency=concurrency)
+    else:
+        flush_cache()
+
 
-        update_last_seen(url, video_id, platform="youtube")
-        print(f"Cached latest video for {name}: {title}")
+def export_channels(path=None, with_webhooks=False):
+    """Write channels, resolved IDs and last_seen as one compact JSON snapshot."""
+    channels = get_channels()
+    channel_ids = load_cache()
+    snapshot = {
+        "channels": [dict(c, channel_id=channel_ids.get(c["url"])) for c in channels],
+        "last_seen": get_last_seen("youtube"),
+    }
+    if with_webhooks:
+        snapshot["webhooks"] = {
+            c["webhook_env"]: os.getenv(c["webhook_env"])
+            for c in channels if os.getenv(c["webhook_env"])
+        }
+
+    data = json.dumps(snapshot, separators=(",", ":"), ensure_ascii=False)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+        print(f"✅ Exported {len(channels)} channels to {path}")
+    else:
+        print(data)
+
+
+# ================= SUBREDDITS =================
+
+def add_subreddit_cmd(name, webhook_env, webhook_url=None):
+    """Watch a subreddit for new posts."""
+    name = name.strip().removeprefix("r/").strip("/")
+    if not name:
+        print("[ERROR] Subreddit name is required.")
+        return
+
+    if not os.getenv(webhook_env) and not webhook_url:
+        print(f"[ERROR] Webhook ENV '{webhook_env}' is not set; pass --webhook-url.")
+        return
+
+    if not add_subreddit(name, webhook_env):
+        print(f"[ERROR] r/{name} is already watched.")
+        return
+    if webhook_url:
+        save_webhook_to_env(webhook_env, webhook_url)
 
-    print("✅ Bootstrap complete. No notifications were sent.")
+    print(f"🎉 r/{name} added (first check caches the latest post only)")
+
+
+def list_subreddits():
+    """List all watched subreddits"""
+    print("\n=== Watched Subreddits ===")
+    subreddits = get_subreddits()
+
+    if not subreddits:
+        print("No subreddits configured.")
+        return
+
+    for s in subreddits:
+        print(f"- r/{s['name']} | {s['webhook_env']}")
+
+
+def remove_subreddit_cmd(name):
+    """Stop watching a subreddit."""
+    name = name.strip().removeprefix("r/").strip("/")
+    if not remove_subreddit(name):
+        print(f"[ERROR] r/{name} is not watched.")
+        return
+    print(f"🗑 Removed r/{name}")
+
+
+# ================= WEBSITES =================
+
+def add_website_cmd(name, url, webhook_env, webhook_url=None, selector=None):
+    """Watch a web page for content changes."""
+    if selector:
+        try:
+            parse_selector(selector)
+        except ValueError as e:
+            print(f"[ERROR] {e}")
+            return
+
+    if not os.getenv(webhook_env) and not webhook_url:
+        print(f"[ERROR] Webhook ENV '{webhook_env}' is not set; pass --webhook-url.")
+        return
+
+    if not add_website(name, url, webhook_env, selector):
+        print(f"[ERROR] A website named '{name}' or with this URL already exists.")
+        return
+    if webhook_url:
+        save_webhook_to_env(webhook_env, webhook_url)
+
+    print(f"🎉 Website '{name}' added (first check stores a baseline only)")
+
+
+def list_websites():
+    """List all watched pages"""
+    print("\n=== Watched Websites ===")
+    websites = get_websites()
+
+    if not websites:
+        print("No websites configured.")
+        return
+
+    for w in websites:
+        selector = f" | {w['selector']}" if w["selector"] else ""
+        print(f"- {w['name']} | {w['url']} | {w['webhook_env']}{selector}")
 
 
 # ================= MAIN CLI =================
 
-def main():
+def interactive():
     print("\nDiscord Monitor Channel Manager")
     print("Commands: add | list | remove | edit | bootstrap")
 
@@ -196,5 +444,76 @@ def main():
         print("❌ Unknown command")
 
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage monitored channels (no command: interactive prompt).")
+    sub = parser.add_subparsers(dest="command")
+
+    p_import = sub.add_parser("import", help="bulk-add channels from CSV, JSON or OPML")
+    p_import.add_argument("file")
+    p_import.add_argument("--format", choices=["csv", "json", "opml"], help="default: from file extension")
+    p_import.add_argument("--webhook-env", help="webhook ENV key for rows without one (required for OPML)")
+    p_import.add_argument("--webhook-url", help="Discord webhook URL to store under --webhook-env")
+    p_import.add_argument("--concurrency", type=int, default=10, help="parallel feed fetches (default: 10)")
+    p_import.add_argument("--no-bootstrap", action="store_true", help="don't cache latest videos")
+
+    p_export = sub.add_parser("export", help="write a JSON snapshot of channels and last seen videos")
+    p_export.add_argument("-o", "--output", help="file to write (default: stdout)")
+    p_export.add_argument("--with-webhooks", action="store_true", help="include webhook URLs (secrets!)")
+
+    p_bootstrap = sub.add_parser("bootstrap", help="cache latest videos so nothing old is announced")
+    p_bootstrap.add_argument("--concurrency", type=int, default=10, help="parallel feed fetches (default: 10)")
+
+    sub.add_parser("list", help="list configured channels")
+
+    p_add_subreddit = sub.add_parser("add-subreddit", help="watch a subreddit for new posts")
+    p_add_subreddit.add_argument("name")
+    p_add_subreddit.add_argument("--webhook-env", required=True, help="webhook ENV key to notify")
+    p_add_subreddit.add_argument("--webhook-url", help="Discord webhook URL to store under --webhook-env")
+
+    sub.add_parser("list-subreddits", help="list watched subreddits")
+
+    p_remove_subreddit = sub.add_parser("remove-subreddit", help="stop watching a subreddit")
+    p_remove_subreddit.add_argument("name")
+
+    p_add_website = sub.add_parser("add-website", help="watch a web page for content changes")
+    p_add_website.add_argument("name")
+    p_add_website.add_argument("url")
+    p_add_website.add_argument("--webhook-env", required=True, help="webhook ENV key to notify")
+    p_add_website.add_argument("--webhook-url", help="Discord webhook URL to store under --webhook-env")
+    p_add_website.add_argument("--selector", help='regions to watch, e.g. "main" or "#content, .post"')
+
+    sub.add_parser("list-websites", help="list watched web pages")
+
+    p_remove_website = sub.add_parser("remove-website", help="stop watching a web page")
+    p_remove_website.add_argument("name")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        import_channels(args.file, args.format, args.webhook_env, args.webhook_url,
+                        concurrency=args.concurrency, run_bootstrap=not args.no_bootstrap)
+    elif args.command == "export":
+        export_channels(args.output, with_webhooks=args.with_webhooks)
+    elif args.command == "bootstrap":
+        bootstrap(concurrency=args.concurrency)
+    elif args.command == "list":
+        list_channels()
+    elif args.command == "add-subreddit":
+        add_subreddit_cmd(args.name, args.webhook_env, args.webhook_url)
+    elif args.command == "list-subreddits":
+        list_subreddits()
+    elif args.command == "remove-subreddit":
+        remove_subreddit_cmd(args.name)
+    elif args.command == "add-website":
+        add_website_cmd(args.name, args.url, args.webhook_env, args.webhook_url, args.selector)
+    elif args.command == "list-websites":
+        list_websites()
+    elif args.command == "remove-website":
+        remove_website(args.name)
+        print(f"🗑 Removed {args.name}")
+    else:
+        interactive()
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,235 @@
+"""
+metrics.py
+
+Minimal Prometheus-style metrics registry with an optional /metrics
+HTTP exporter. Counters, gauges and histograms are thread-safe and
+support label values.
+"""
+
+import os
+import time
+import bisect
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Port for the /metrics exporter (0 = disabled)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+logger = logging.getLogger("discord_monitor.metrics")
+
+_registry = []
+
+
+def _escape_label(value):
+    """Escape a label value as the Prometheus text format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    inner = ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs)
+    return "{" + inner + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or computed at scrape time by a callback."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self.callback:
+            try:
+                self.set(self.callback())
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of a with-block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.label_names, key, [("le", bound)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+def render():
+    """Render every registered metric in Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ================= METRICS =================
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Outbound HTTP request latency", labels=("host", "method")
+)
+HTTP_RESPONSES = Counter(
+    "http_responses_total", "Outbound HTTP responses by status", labels=("host", "status")
+)
+
+FEED_FETCH_SECONDS = Histogram("feed_fetch_seconds", "RSS feed request latency (to headers)")
+FEED_PARSE_SECONDS = Histogram("feed_parse_seconds", "RSS feed streaming read + parse time")
+FEED_REQUESTS = Counter("feed_requests_total", "RSS feed requests by result", labels=("result",))
+FEED_NOT_MODIFIED_RATIO = Gauge(
+    "feed_not_modified_ratio", "Share of feed requests answered 304 since start",
+    callback=lambda: (
+        FEED_REQUESTS.value(result="not_modified")
+        / max(1, sum(FEED_REQUESTS.value(result=r) for r in ("ok", "not_modified", "error")))
+    ),
+)
+
+REDDIT_REQUESTS = Counter("reddit_requests_total", "Reddit listing requests by result", labels=("result",))
+
+CIRCUIT_OPEN = Gauge("circuit_open", "1 while a host's circuit breaker is open", labels=("host",))
+CIRCUIT_SHORT_CIRCUITS = Counter(
+    "circuit_short_circuits_total", "Requests refused by an open circuit", labels=("host",)
+)
+
+RESOLVE_SECONDS = Histogram("channel_resolve_seconds", "Channel ID resolution time")
+RESOLVE_LOOKUPS = Counter(
+    "channel_resolve_total", "Channel ID resolutions by source", labels=("source",)
+)
+
+DB_WRITE_SECONDS = Histogram("db_write_seconds", "SQLite write transaction time", labels=("op",))
+
+WEBHOOK_SEND_SECONDS = Histogram("webhook_send_seconds", "Discord webhook request latency")
+WEBHOOK_RESULTS = Counter("webhook_results_total", "Discord webhook outcomes", labels=("result",))
+DISCORD_RATE_LIMITED = Counter("discord_rate_limited_total", "Discord 429 responses", labels=("scope",))
+NOTIFICATIONS_QUEUED = Counter("notifications_queued_total", "Notifications handed to delivery")
+
+CYCLE_SECONDS = Histogram("cycle_seconds", "Monitor module run duration", labels=("module",))
+CYCLE_LAST_SECONDS = Gauge("cycle_last_seconds", "Duration of each module's last run", labels=("module",))
+MODULE_TIMEOUTS = Counter("module_timeouts_total", "Module runs that overran their timeout", labels=("module",))
+CHECK_INTERVAL_SECONDS = Gauge("check_interval_seconds", "Configured CHECK_INTERVAL")
+
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# Queue depth callbacks are attached by the modules that own the queues
+DISPATCHER_QUEUE_DEPTH = Gauge("dispatcher_queue_depth", "Embeds waiting in webhook queues")
+OUTBOX_QUEUE_DEPTH = Gauge("outbox_queue_depth", "Pending rows in the notification outbox")
+
+
+# ================= EXPORTER =================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve /metrics in a background thread. Returns the server, or None if disabled."""
+    if not port:
+        return None
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics exporter listening on {host}:{port}/metrics")
+    return server
@@ -0,0 +1,254 @@
+"""
+monitor_reddit.py
+
+Handles Reddit monitoring logic.
+Called by main.py on a schedule.
+"""
+
+import os
+import time
+import logging
+from dotenv import load_dotenv
+
+from db import get_subreddits, get_last_seen_many, record_detections
+from config import config_watcher
+from reddit import fetch_listing, post_number, REDDIT_HOST
+from discord import build_link_embed
+from outbox import outbox_worker
+from poller import poll_all
+from sharding import shard
+from circuit import FailureBackoff
+from metrics import DB_WRITE_SECONDS, NOTIFICATIONS_QUEUED
+
+load_dotenv()
+
+logger = logging.getLogger("discord_monitor.reddit")
+
+# Subreddits merged into one listing request (URL length keeps this near 100)
+REDDIT_BATCH_SIZE = int(os.getenv("REDDIT_BATCH_SIZE", 100))
+
+# Older listing pages fetched per batch when a busy subreddit pushes others out
+REDDIT_MAX_PAGES = int(os.getenv("REDDIT_MAX_PAGES", 3))
+
+# Slack for post timestamps when deciding a page reaches back to the last check (seconds)
+REDDIT_OVERLAP = 60
+
+# When each subreddit's listing was last read to the end of new posts
+_last_checked = {}
+
+# Banned, private or missing subreddits are skipped for growing periods
+subreddit_backoff = FailureBackoff()
+
+
+def build_post_embed(post):
+    """Embed for a new Reddit post."""
+    description = f"🧵 New post in **r/{post['subreddit']}**"
+    if post["flair"]:
+        description += f" · {post['flair']}"
+    return build_link_embed(
+        post["title"], post["permalink"], description,
+        color=0xFF4500, image_url=post["thumbnail_url"],
+    )
+
+
+def _is_rejected(listing):
+    status = listing["status"]
+    return listing["error"] and status is not None and 400 <= status < 500 and status != 429
+
+
+def fetch_batch(names, watermarks, expired=lambda: False):
+    """
+    Fetch new posts for a batch of subreddits.
+    Reddit rejects a whole merged listing (403/404) if one subreddit in it
+    is banned, private or missing, so a rejected batch is split in halves
+    until the bad names are isolated.
+
+    Returns a fetch_pages() dict plus:
+        names  - subreddits whose listing was read
+        failed - {name: status} for subreddits Reddit rejected on their own
+    or None if expired() was already true.
+    """
+    listing = fetch_pages(names, watermarks, expired)
+    if listing is None:
+        return None
+
+    listing["names"] = [] if listing["error"] else list(names)
+    listing["failed"] = {}
+    if not _is_rejected(listing):
+        return listing
+
+    if len(names) == 1:
+        listing["failed"] = {names[0]: listing["status"]}
+        return listing
+
+    merged = {"error": False, "status": listing["status"], "posts": [], "names": [], "failed": {}}
+    middle = len(names) // 2
+    for part in (names[:middle], names[middle:]):
+        result = fetch_batch(part, watermarks, expired)
+        if result is None:
+            continue
+        merged["posts"].extend(result["posts"])
+        merged["names"].extend(result["names"])
+        merged["failed"].update(result["failed"])
+
+    merged["posts"].sort(key=lambda post: post["number"], reverse=True)
+    return merged
+
+
+def fetch_pages(names, watermarks, expired=lambda: False):
+    """
+    Fetch new posts for a merged listing of subreddits, newest first.
+    Older pages are only read while some subreddit in the batch may still
+    have unseen posts: until the listing passes every watermark or reaches
+    back to the batch's previous check.
+    Once expired() is true no further pages are read, and a batch that
+    has not started is skipped (None).
+    Runs on a poller worker thread, so it must not touch the DB or Discord.
+    """
+    marks = [watermarks.get(name) for name in names]
+    floor = min(post_number(m) for m in marks) if all(marks) else None
+    since = min(_last_checked.get(name, 0) for name in names)
+
+    posts = []
+    after = None
+    for page in range(REDDIT_MAX_PAGES):
+        if expired():
+            if page == 0:
+                return None
+            break
+
+        listing = fetch_listing(names, after=after)
+        if listing["error"]:
+            # A partial listing could move watermarks past unread posts
+            return listing
+
+        posts.extend(listing["posts"])
+        after = listing["after"]
+        if not after or not listing["posts"]:
+            break
+
+        # A first run only needs the newest posts
+        if floor is None and not since:
+            break
+
+        oldest = listing["posts"][-1]
+        if (floor is not None and oldest["number"] <= floor) or oldest["created"] < since - REDDIT_OVERLAP:
+            break
+    else:
+        logger.debug("Stopped after %d listing pages for %d subreddits", REDDIT_MAX_PAGES, len(names))
+
+    return {"error": False, "status": listing["status"], "posts": posts}
+
+
+def check_reddit(ctx=None):
+    """
+    Check all watched subreddits for new posts.
+    Subreddits are batched into merged listings, so N subreddits cost
+    about N / REDDIT_BATCH_SIZE requests per cycle. Subreddits Reddit
+    rejects (banned, private, missing) are backed off on their own.
+    ctx is the runtime.ModuleContext; its concurrency caps parallel fetches,
+    and once its timeout passes, batches not yet fetched are skipped.
+    """
+    logger.info("Starting Reddit check cycle")
+    expired = ctx.expired if ctx else lambda: False
+
+    # Keeps webhook URLs in os.environ current with .env
+    config_watcher.current()
+
+    now = time.time()
+    subreddits = {}
+    for sub in get_subreddits():
+        if not os.getenv(sub["webhook_env"]):
+            logger.error("Missing webhook ENV: %s", sub["webhook_env"])
+            continue
+        name = sub["name"].lower()
+        if shard.owns(name) and not subreddit_backoff.blocked(name, now):
+            subreddits[name] = sub
+
+    if not subreddits:
+        logger.info("No subreddits due this cycle")
+        return
+
+    # High-watermark fullname per subreddit
+    watermarks = get_last_seen_many(subreddits, platform="reddit")
+
+    names = sorted(subreddits)
+    batches = [names[i:i + REDDIT_BATCH_SIZE] for i in range(0, len(names), REDDIT_BATCH_SIZE)]
+
+    results = poll_all(
+        batches,
+        fetch=lambda batch: fetch_batch(batch, watermarks, expired),
+        host_of=lambda batch: REDDIT_HOST,
+        max_workers=ctx.concurrency if ctx else None,
+    )
+
+    # Watermarks and the notification outbox are written in one transaction
+    detections = []
+    skipped = 0
+
+    for batch, listing, error in results:
+        if error:
+            logger.error("Reddit error for %d subreddits: %s", len(batch), error, exc_info=error)
+            continue
+        if listing is None:
+            skipped += len(batch)
+            continue
+
+        for name, status in listing["failed"].items():
+            delay = subreddit_backoff.failure(name, now)
+            logger.warning("r/%s returned %s, skipping it for %.0fs", name, status, delay)
+
+        if listing["error"]:
+            continue
+
+        # Fan the merged listing out to its subreddits (newest first)
+        by_subreddit = {}
+        seen = set()
+        for post in listing["posts"]:
+            if post["fullname"] not in seen:
+                seen.add(post["fullname"])
+                by_subreddit.setdefault(post["subreddit"], []).append(post)
+
+        for name in listing["names"]:
+            subreddit_backoff.success(name)
+            _last_checked[name] = now
+            posts = by_subreddit.get(name, [])
+            previous = watermarks.get(name)
+
+            # First-run bootstrap (NO DISCORD NOTIFICATION). A quiet
+            # subreddit starts at the listing's newest post, since IDs are global.
+            if previous is None:
+                newest = posts[0] if posts else (listing["posts"][0] if listing["posts"] else None)
+                if newest:
+                    logger.info("First run detected for r/%s. Caching latest post only.", name)
+                    detections.append((name, None, newest["fullname"], []))
+                continue
+
+            threshold = post_number(previous)
+            new_posts = [p for p in posts if p["number"] > threshold]
+            if not new_posts:
+                logger.debug("No new post for r/%s", name)
+                continue
+
+            webhook_env = subreddits[name]["webhook_env"]
+            notifications = []
+            for post in reversed(new_posts):
+                logger.info("NEW POST detected in r/%s: %s", name, post["title"])
+                notifications.append((webhook_env, build_post_embed(post)))
+            detections.append((name, previous, new_posts[0]["fullname"], notifications))
+
+    with DB_WRITE_SECONDS.time(op="record_detections"):
+        queued = record_detections(detections, platform="reddit")
+    NOTIFICATIONS_QUEUED.inc(queued)
+
+    # Deliver right away rather than on the outbox's next poll
+    if queued:
+        outbox_worker.wake()
+
+    if skipped:
+        logger.warning(f"Reddit check cycle ran past its timeout: {skipped} subreddits skipped")
+
+    logger.info(
+        f"Reddit check cycle finished: {len(subreddits)} subreddits in "
+        f"{len(batches)} batches, {queued} new posts"
+    )
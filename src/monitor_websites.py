@@ -0,0 +1,183 @@
+"""
+monitor_websites.py
+
+Handles website change monitoring logic.
+Called by main.py on a schedule.
+"""
+
+import os
+import time
+import logging
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+from db import get_websites, get_website_states, record_website_checks
+from config import config_watcher
+from website import fetch_page, extract_blocks, fingerprint, block_hash, hamming, pack_hashes, unpack_hashes
+from discord import build_link_embed
+from outbox import outbox_worker
+from poller import poll_all
+from sharding import shard
+from circuit import FailureBackoff
+from metrics import DB_WRITE_SECONDS, NOTIFICATIONS_QUEUED
+
+load_dotenv()
+
+logger = logging.getLogger("discord_monitor.websites")
+
+# SimHash bit distance at or below which a page only drifted (ads, dates, counters)
+WEBSITE_SIMHASH_THRESHOLD = int(os.getenv("WEBSITE_SIMHASH_THRESHOLD", 3))
+
+# New text blocks quoted in a change notification
+WEBSITE_SNIPPETS = 3
+WEBSITE_SNIPPET_CHARS = 200
+
+# Pages that keep failing (404, 410, ...) are skipped for growing periods
+page_backoff = FailureBackoff()
+
+
+def fetch_fingerprint(site, state, expired=lambda: False):
+    """
+    Fetch a page and fingerprint its selected regions.
+    Runs on a poller worker thread, so it must not touch the DB or Discord.
+    Returns the fetch_page() dict plus blocks, simhash and block_hashes,
+    or None if expired() says the module is out of time.
+    """
+    if expired():
+        return None
+
+    etag, last_modified = (state[0], state[1]) if state else (None, None)
+    page = fetch_page(site["url"], etag=etag, last_modified=last_modified)
+    if page["error"] or page["not_modified"]:
+        return page
+
+    page["blocks"] = extract_blocks(page.pop("html"), site["selector"])
+    page["simhash"], page["block_hashes"] = fingerprint(page["blocks"])
+    return page
+
+
+def build_change_embed(site, new_blocks):
+    """Embed listing the first few new text blocks of a changed page."""
+    lines = []
+    for block in new_blocks[:WEBSITE_SNIPPETS]:
+        if len(block) > WEBSITE_SNIPPET_CHARS:
+            block = block[:WEBSITE_SNIPPET_CHARS - 1] + "…"
+        lines.append(f"> {block}")
+
+    more = len(new_blocks) - WEBSITE_SNIPPETS
+    if more > 0:
+        lines.append(f"…and {more} more")
+
+    summary = f"🌐 **{site['name']}** changed ({len(new_blocks)} new block{'s' if len(new_blocks) != 1 else ''})"
+    return build_link_embed(site["name"], site["url"], "\n".join([summary, *lines]), color=0x2ECC71)
+
+
+def check_websites(ctx=None):
+    """
+    Check all watched pages for content changes.
+    ctx is the runtime.ModuleContext; its concurrency caps parallel fetches,
+    and once its timeout passes, pages not yet fetched are skipped.
+    """
+    logger.info("Starting website check cycle")
+    expired = ctx.expired if ctx else lambda: False
+
+    # Keeps webhook URLs in os.environ current with .env
+    config_watcher.current()
+
+    now = time.time()
+    sites = []
+    for site in get_websites():
+        if not os.getenv(site["webhook_env"]):
+            logger.error("Missing webhook ENV: %s", site["webhook_env"])
+            continue
+        if shard.owns(site["url"]) and not page_backoff.blocked(site["url"], now):
+            sites.append(site)
+
+    if not sites:
+        logger.info("No websites due this cycle")
+        return
+
+    states = get_website_states()
+
+    results = poll_all(
+        sites,
+        fetch=lambda site: fetch_fingerprint(site, states.get(site["url"]), expired),
+        host_of=lambda site: urlparse(site["url"]).hostname,
+        max_workers=ctx.concurrency if ctx else None,
+    )
+
+    # Fingerprints and the notification outbox are written in one transaction
+    updates = []
+    notifications = []
+    skipped = 0
+
+    for site, page, error in results:
+        name = site["name"]
+        url = site["url"]
+
+        if error:
+            logger.error("Website error for %s: %s", name, error, exc_info=error)
+            continue
+
+        if page is None:
+            skipped += 1
+            continue
+
+        if page["error"]:
+            status = page["status"]
+            if status and 400 <= status < 500 and status != 429:
+                delay = page_backoff.failure(url, now)
+                logger.warning("Page %s returned %s, skipping it for %.0fs", name, status, delay)
+            continue
+
+        page_backoff.success(url)
+        state = states.get(url)
+
+        # Unchanged since last cycle (HTTP 304): only the check time moves
+        if page["not_modified"]:
+            logger.debug("Page not modified: %s", name)
+            updates.append((url, page["etag"], page["last_modified"], state[2], state[3], now, None))
+            continue
+
+        simhash_hex = f"{page['simhash']:016x}"
+        packed = pack_hashes(page["block_hashes"])
+
+        # First-run baseline (NO DISCORD NOTIFICATION)
+        if state is None or state[2] is None:
+            logger.info("First run detected for %s. Storing page fingerprint only.", name)
+            updates.append((url, page["etag"], page["last_modified"], simhash_hex, packed, now, now))
+            continue
+
+        known = set(unpack_hashes(state[3]))
+        new_blocks = [block for block in page["blocks"] if block_hash(block) not in known]
+        distance = hamming(page["simhash"], int(state[2], 16))
+
+        # Near-duplicate: keep the old baseline so small drifts add up
+        # until they amount to a real change
+        if distance <= WEBSITE_SIMHASH_THRESHOLD:
+            logger.debug("Page %s unchanged (distance %d)", name, distance)
+            updates.append((url, page["etag"], page["last_modified"], state[2], state[3], now, None))
+            continue
+
+        # Content only removed or reordered: nothing to announce
+        if not new_blocks:
+            logger.info("Page %s lost content (distance %d), updating fingerprint", name, distance)
+            updates.append((url, page["etag"], page["last_modified"], simhash_hex, packed, now, now))
+            continue
+
+        logger.info("PAGE CHANGE detected for %s: %d new blocks, distance %d", name, len(new_blocks), distance)
+        notifications.append((site["webhook_env"], build_change_embed(site, new_blocks)))
+        updates.append((url, page["etag"], page["last_modified"], simhash_hex, packed, now, now))
+
+    with DB_WRITE_SECONDS.time(op="website_state"):
+        record_website_checks(updates, notifications)
+    NOTIFICATIONS_QUEUED.inc(len(notifications))
+
+    # Deliver right away rather than on the outbox's next poll
+    if notifications:
+        outbox_worker.wake()
+
+    if skipped:
+        logger.warning(f"Website check cycle ran past its timeout: {skipped} pages skipped")
+
+    logger.info(f"Website check cycle finished: {len(notifications)} of {len(sites)} pages changed")
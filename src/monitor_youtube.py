@@ -6,91 +6,346 @@ Called by main.py on a schedule.
 """
 
 import os
+import time
 import logging
+from datetime import datetime
+from threading import Lock
 from dotenv import load_dotenv
 
-from db import get_channels, get_last_seen, update_last_seen, get_last_seen_for_channel
-from youtube import get_latest_video
-from channel_cache import resolve_channel_id
-from discord import send_discord_notification
+from db import (
+    get_last_seen_many, get_last_seen_for_channel, record_detections,
+    get_feed_validators, update_feed_validators_many
+)
+from config import config_watcher
+from youtube import fetch_feed, diff_entries, FEED_HOST
+from channel_cache import resolve_channel_ids, flush_cache, load_cache
+from discord import build_embed
+from outbox import outbox_worker
+from poller import poll_all
+from scheduler import AdaptiveScheduler
+from sharding import shard
+from circuit import FailureBackoff
+from seen import SeenCache
+from websub import WEBSUB_ENABLED, WEBSUB_RECONCILE_INTERVAL
+from metrics import DB_WRITE_SECONDS, NOTIFICATIONS_QUEUED
 
-# Logger (will be configured globally later)
+load_dotenv()
+
+# Logger (will be configured globally later).
+# Per-channel messages use lazy %-style args: nothing is formatted when
+# the level is off, and the rate limit groups them by call site.
 logger = logging.getLogger("discord_monitor.youtube")
 
+# Per-channel polling schedule (adapts to each channel's upload cadence)
+youtube_scheduler = AdaptiveScheduler("youtube")
+
+# With WebSub pushes, polling is only a slow reconciliation sweep
+if WEBSUB_ENABLED:
+    youtube_scheduler.fixed_interval = WEBSUB_RECONCILE_INTERVAL
+
+# Recently seen video IDs per channel URL (bounded, persisted in seen_items)
+youtube_seen = SeenCache("youtube")
+
+# Pushed entries older than this (seconds) are edits, not uploads
+WEBSUB_MAX_ENTRY_AGE = int(os.getenv("WEBSUB_MAX_ENTRY_AGE", 2 * 86400))
+
+# Serializes detection between the poll cycle and WebSub pushes
+_detect_lock = Lock()
+
+# Channels whose feeds keep failing (404, 410, ...) are skipped for growing periods
+feed_backoff = FailureBackoff()
+
+
+def remember_seen(url, entries):
+    """Stage entry IDs for the channel's seen history (see _record_detections)."""
+    youtube_seen.remember(url, [entry["video_id"] for entry in entries])
+
+
+def _record_detections(detections):
+    """
+    Write detections with the staged seen IDs in one transaction. The IDs
+    only count as seen once it commits; if it raises they are dropped,
+    last_seen stays put and the next cycle detects the videos again.
+    """
+    seen = youtube_seen.drain()
+    queued = record_detections(detections, platform="youtube", seen=seen)
+    youtube_seen.commit(seen)
+    return queued
+
+
+def detect_new_videos(channel, entries, previous_video):
+    """
+    Shared detection step for polled and pushed feed entries.
+    Diffs entries (newest first) against the channel's last_seen marker
+    and seen set, remembers them, and returns (webhook_env, embed) pairs
+    for every new video, oldest first.
+    """
+    name = channel["name"]
+    url = channel["url"]
+
+    new_entries = diff_entries(entries, previous_video, youtube_seen.get(url))
+    remember_seen(url, entries)
+
+    if not new_entries:
+        logger.debug("No new video for %s", name)
+        return []
+
+    notifications = []
 
-def check_youtube():
-    """Check all configured YouTube channels for new uploads."""
-    load_dotenv(override=True)
+    # NEW VIDEOS DETECTED (oldest first)
+    for entry in new_entries:
+        logger.info("NEW VIDEO detected for %s: %s", name, entry["title"])
 
+        embed = build_embed(
+            title=entry["title"],
+            channel_name=name,
+            video_id=entry["video_id"],
+            thumbnail_url=entry["thumbnail_url"]
+        )
+        notifications.append((channel["webhook_env"], embed))
+
+    return notifications
+
+
+def fetch_channel(channel_id, validators=None, stop_at=None):
+    """
+    Fetch a resolved channel's feed.
+    If validators ({channel_id: (etag, last_modified)}) is given, the
+    fetch is conditional. Parsing stops at the stop_at video ID.
+    Runs on a poller worker thread, so it must not touch last_seen or
+    Discord.
+    """
+    etag, last_modified = (validators or {}).get(channel_id, (None, None))
+    return fetch_feed(channel_id, etag=etag, last_modified=last_modified, stop_at=stop_at)
+
+
+def check_youtube(ctx=None):
+    """
+    Check all configured YouTube channels for new uploads.
+    ctx is the runtime.ModuleContext; its concurrency caps parallel fetches,
+    and once its timeout passes, feeds not yet fetched are skipped.
+    """
     logger.info("Starting YouTube check cycle")
+    expired = ctx.expired if ctx else lambda: False
 
-    # Load channels from SQLite
-    channels = get_channels()
-    if not channels:
+    # Channels and webhooks, reloaded only when .env or the DB changed
+    config = config_watcher.current()
+    if not config.channels:
         logger.info("No YouTube channels configured")
         return
 
-    # Load last seen cache once
-    last_seen_data = get_last_seen()
-    youtube_last_seen = last_seen_data.get("youtube", {})
+    # Skip channels without a webhook before spending a request on them
+    with_webhook = []
+    for channel in config.channels:
+        webhook_url = config.webhook_url(channel["webhook_env"])
+        if not webhook_url:
+            logger.error("Missing webhook ENV: %s", channel["webhook_env"])
+            continue
+        with_webhook.append((channel, webhook_url))
 
-    # Loop channels
-    for channel in channels:
-        name = channel["name"]
-        url = channel["url"]
-        webhook_env = channel["webhook_env"]
+    # Only poll this replica's share. This filter runs before due() so a
+    # replica never reschedules (and saves) channels another one owns;
+    # channels it inherits are overdue in its scheduler and due right away.
+    now = time.time()
+    with_webhook = [(channel, webhook_url) for channel, webhook_url in with_webhook
+                    if shard.owns(channel["url"])]
 
-        logger.info(f"Checking YouTube channel: {name}")
+    # Only poll channels whose adaptive interval has elapsed. Backoff is
+    # applied after due(), so a blocked channel keeps its regular slots
+    # and is polled again on the first one after the backoff ends.
+    due_urls = set(youtube_scheduler.due([channel["url"] for channel, _ in with_webhook], now))
+    due_urls = {url for url in due_urls if not feed_backoff.blocked(url, now)}
+    with_webhook = [(channel, webhook_url) for channel, webhook_url in with_webhook
+                    if channel["url"] in due_urls]
+    if not with_webhook:
+        logger.info("No YouTube channels due this cycle")
+        youtube_scheduler.save()
+        return
 
-        # Load webhook
-        webhook_url = os.getenv(webhook_env)
-        if not webhook_url:
-            logger.error(f"Missing webhook ENV: {webhook_env}")
+    # Last seen markers for just the channels being polled
+    youtube_last_seen = get_last_seen_many(due_urls, platform="youtube")
+
+    # Resolve all channel IDs in one pass (cached, deduplicated, concurrent)
+    channel_ids = resolve_channel_ids([channel["url"] for channel, _ in with_webhook])
+
+    pending = []
+    for channel, webhook_url in with_webhook:
+        channel_id = channel_ids.get(channel["url"])
+        if not channel_id:
+            logger.warning("Could not resolve channel ID for %s", channel["name"])
             continue
+        pending.append((channel, webhook_url, channel_id))
 
-        try:
-            # Resolve channel ID (cached)
-            channel_id = resolve_channel_id(url)
-            if not channel_id:
-                logger.warning(f"Could not resolve channel ID for {name}")
-                continue
+    # Feed validators from the previous cycle, keyed by channel ID
+    validators = get_feed_validators()
 
-            # Fetch latest video
-            video_id, title, thumbnail = get_latest_video(channel_id)
-            if not video_id:
-                logger.warning(f"No video found for {name}")
-                continue
+    def fetch(job):
+        channel, _, channel_id = job
+        # Past the module timeout: leave the rest for the next cycle
+        if expired():
+            return None
+        # Only send validators once a video is cached, so a 304 can't
+        # skip the first-run bootstrap
+        if channel["url"] not in youtube_last_seen:
+            return fetch_channel(channel_id)
+        return fetch_channel(channel_id, validators, stop_at=youtube_last_seen[channel["url"]])
+
+    # Fetch all feeds concurrently
+    results = poll_all(pending, fetch=fetch, host_of=lambda job: FEED_HOST,
+                       max_workers=ctx.concurrency if ctx else None)
 
-            # Get last seen video
-            previous_video = youtube_last_seen.get(url)
-            is_first_run = previous_video is None
+    fetched = 0
+    not_modified = 0
+    skipped = 0
 
-            # First-run bootstrap (NO DISCORD NOTIFICATION)
-            if is_first_run:
-                logger.info(f"First run detected for {name}. Caching latest video only.")
-                update_last_seen(url, video_id, platform="youtube")
+    # Written at the end of the cycle: last_seen and the notification
+    # outbox in one transaction, validators in another
+    detections = []
+    validator_updates = []
+    queued = 0
+
+    # Pushed WebSub entries go through the same detection state
+    with _detect_lock:
+        # Re-read markers in case a push advanced them while feeds were fetched
+        youtube_last_seen = get_last_seen_many(due_urls, platform="youtube")
+
+        # Seen history for every due channel in one query
+        youtube_seen.load(due_urls)
+
+        # Apply results in channel order
+        for (channel, webhook_url, channel_id), feed, error in results:
+            name = channel["name"]
+            url = channel["url"]
+
+            logger.info("Checking YouTube channel: %s", name)
+
+            if error:
+                logger.error("YouTube error for %s: %s", name, error, exc_info=error)
                 continue
 
-            # No new video
-            if previous_video == video_id:
-                logger.debug(f"No new video for {name}")
+            if feed is None:
+                # due() already moved it to its next slot; keep it due instead
+                youtube_scheduler.defer(url, now)
+                skipped += 1
                 continue
 
-            # NEW VIDEO DETECTED
-            logger.info(f"NEW VIDEO detected for {name}: {title}")
+            try:
+                if feed["error"]:
+                    # A 4xx is this channel's problem; host-wide failures trip the circuit breaker
+                    status = feed["status"]
+                    if status and 400 <= status < 500 and status != 429:
+                        delay = feed_backoff.failure(url, now)
+                        logger.warning("Feed for %s returned %s, skipping it for %.0fs", name, status, delay)
+                    continue
+
+                feed_backoff.success(url)
+                fetched += 1
+
+                # Feed unchanged since last cycle (HTTP 304)
+                if feed["not_modified"]:
+                    not_modified += 1
+                    logger.debug("Feed not modified for %s", name)
+                    continue
+
+                entries = feed["entries"]
+
+                # Learn the channel's upload cadence from what was parsed
+                youtube_scheduler.observe(url, entries, now)
+
+                if not entries:
+                    logger.warning("No video found for %s", name)
+                    continue
+
+                latest_id = entries[0]["video_id"]
+                previous_video = youtube_last_seen.get(url)
+
+                # First-run bootstrap (NO DISCORD NOTIFICATION)
+                if previous_video is None:
+                    logger.info("First run detected for %s. Caching latest video only.", name)
+                    detections.append((url, None, latest_id, []))
+                    validator_updates.append((channel_id, feed["etag"], feed["last_modified"]))
+                    remember_seen(url, entries)
+                    continue
+
+                found = detect_new_videos(channel, entries, previous_video)
+                if found or latest_id != previous_video:
+                    detections.append((url, previous_video, latest_id, found))
+                validator_updates.append((channel_id, feed["etag"], feed["last_modified"]))
+
+            except Exception as e:
+                logger.exception("YouTube error for %s: %s", name, e)
+
+        with DB_WRITE_SECONDS.time(op="record_detections"):
+            queued = _record_detections(detections)
+        with DB_WRITE_SECONDS.time(op="feed_validators"):
+            update_feed_validators_many(validator_updates)
+        with DB_WRITE_SECONDS.time(op="poll_schedule"):
+            youtube_scheduler.save()
+        with DB_WRITE_SECONDS.time(op="channel_ids"):
+            flush_cache()
+        NOTIFICATIONS_QUEUED.inc(queued)
+
+    # Deliver right away rather than on the outbox's next poll
+    if queued:
+        outbox_worker.wake()
+
+    if skipped:
+        logger.warning(f"YouTube check cycle ran past its timeout: {skipped} channels skipped")
+
+    hit_ratio = (not_modified / fetched * 100) if fetched else 0.0
+    logger.info(
+        f"YouTube check cycle finished: {not_modified}/{fetched} feeds "
+        f"not modified ({hit_ratio:.1f}% 304 hit ratio)"
+    )
+
+
+def _is_recent(entry, now):
+    try:
+        published = datetime.fromisoformat(entry["published"]).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return now - published <= WEBSUB_MAX_ENTRY_AGE
+
+
+def handle_pushed_entries(channel_id, entries):
+    """
+    Detection path for entries pushed by the WebSub hub.
+    Runs on a callback server thread. Channels without a last_seen entry
+    are left for the poll cycle to bootstrap.
+    """
+    now = time.time()
+
+    # Hubs also push title/description edits of old videos
+    entries = [e for e in entries if _is_recent(e, now)]
+    if not entries:
+        return
+
+    # The polling thread may add entries meanwhile, so iterate a snapshot
+    urls = {url for url, cid in list(load_cache().items()) if cid == channel_id}
+    channels = [c for c in config_watcher.current().channels if c["url"] in urls]
+    if not channels:
+        logger.warning("WebSub push for unknown channel %s", channel_id)
+        return
+
+    detections = []
+
+    with _detect_lock:
+        for channel in channels:
+            url = channel["url"]
+            previous_video = get_last_seen_for_channel(url, platform="youtube")
+            if previous_video is None:
+                continue
 
-            send_discord_notification(
-                title=title,
-                channel_name=name,
-                video_id=video_id,
-                webhook_url=webhook_url,
-                thumbnail=thumbnail
-            )
+            found = detect_new_videos(channel, entries, previous_video)
+            if found:
+                detections.append((url, previous_video, entries[0]["video_id"], found))
 
-            # Update last seen
-            update_last_seen(url, video_id, platform="youtube")
+            youtube_scheduler.observe(url, entries, now)
 
-        except Exception as e:
-            logger.exception(f"YouTube error for {name}: {e}")
+        with DB_WRITE_SECONDS.time(op="record_detections"):
+            queued = _record_detections(detections)
+        NOTIFICATIONS_QUEUED.inc(queued)
+        youtube_scheduler.save()
 
-    logger.info("YouTube check cycle finished")
+    if queued:
+        outbox_worker.wake()
@@ -0,0 +1,136 @@
+"""
+outbox.py
+
+Delivery worker for the SQLite notification outbox.
+Monitors write notifications to the outbox in the same transaction that
+advances last_seen; this worker drains it in batches through the
+Discord dispatcher and deletes rows once Discord has accepted them.
+With sharding, only the shard leader drains.
+"""
+
+import os
+import logging
+from threading import Event, Lock, Thread
+from dotenv import load_dotenv
+
+from db import claim_outbox, release_outbox_claims, ack_outbox, fail_outbox, reject_outbox, count_outbox
+from dispatcher import dispatcher, SENT, FAILED, REJECTED
+from metrics import OUTBOX_QUEUE_DEPTH
+from sharding import shard
+
+load_dotenv()
+
+# Rows handed to the dispatcher per drain
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+
+# Seconds between drains when nothing wakes the worker
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 10))
+
+# Seconds before a failed row is retried, and attempts before it is marked dead
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", 300))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+
+# Seconds after which a row still marked sending is taken as abandoned and
+# sent again (well past the dispatcher's own retries, to avoid duplicates)
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv("OUTBOX_CLAIM_TIMEOUT", 600))
+
+logger = logging.getLogger("discord_monitor.outbox")
+
+
+class OutboxWorker:
+    """Background thread that moves outbox rows into the dispatcher."""
+
+    def __init__(self):
+        self._wake = Event()
+        self._stop = Event()
+        self._lock = Lock()
+        self._acked = []
+        self._failed = []
+        self._rejected = []
+        self._thread = None
+
+    def start(self):
+        """Start draining (rows abandoned by a crashed process are recovered as they time out)."""
+        self._thread = Thread(target=self._run, name="outbox", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """Drain now instead of waiting for the next poll."""
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        """Stop draining, then record outcomes of anything already sent."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.record_outcomes()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.record_outcomes()
+                self._drain()
+            except Exception as e:
+                logger.exception(f"Outbox drain failed: {e}")
+
+            self._wake.wait(OUTBOX_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _drain(self):
+        if not shard.is_leader():
+            return
+
+        # Claims abandoned by a crashed process or a previous leader
+        released = release_outbox_claims(OUTBOX_CLAIM_TIMEOUT)
+        if released:
+            logger.warning(f"Released {released} abandoned outbox claims")
+
+        while not self._stop.is_set():
+            rows = claim_outbox(OUTBOX_BATCH_SIZE)
+            if not rows:
+                return
+
+            for row_id, webhook_env, embed in rows:
+                webhook_url = os.getenv(webhook_env)
+                if not webhook_url:
+                    logger.error(f"Missing webhook ENV: {webhook_env}")
+                    self._done(row_id, FAILED)
+                    continue
+                dispatcher.enqueue(
+                    webhook_url, embed, on_done=lambda outcome, row_id=row_id: self._done(row_id, outcome)
+                )
+
+            logger.debug(f"Handed {len(rows)} outbox rows to dispatcher")
+
+    def _done(self, row_id, outcome):
+        # Called from dispatcher threads; outcomes are written in batches
+        with self._lock:
+            if outcome == SENT:
+                self._acked.append(row_id)
+            elif outcome == REJECTED:
+                self._rejected.append(row_id)
+            else:
+                self._failed.append(row_id)
+
+    def record_outcomes(self):
+        """Write delivery results collected from the dispatcher to the outbox."""
+        with self._lock:
+            acked, self._acked = self._acked, []
+            failed, self._failed = self._failed, []
+            rejected, self._rejected = self._rejected, []
+
+        if acked:
+            ack_outbox(acked)
+        if rejected:
+            # Discord refused the embed itself; retrying can never succeed
+            logger.error(f"{len(rejected)} notifications rejected by Discord, marking them dead")
+            reject_outbox(rejected)
+        if failed:
+            logger.warning(f"{len(failed)} notifications failed, retrying in {OUTBOX_RETRY_DELAY}s")
+            fail_outbox(failed, OUTBOX_RETRY_DELAY, OUTBOX_MAX_ATTEMPTS)
+
+
+# Shared worker for the whole bot
+outbox_worker = OutboxWorker()
+OUTBOX_QUEUE_DEPTH.callback = count_outbox
@@ -0,0 +1,107 @@
+"""
+poller.py
+
+Concurrent polling engine for monitor modules.
+Runs blocking fetch jobs on a bounded thread pool while capping
+how many requests hit the same host at once and how many start
+per second overall.
+"""
+
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Max fetches in flight across all hosts
+MAX_IN_FLIGHT = int(os.getenv("POLL_MAX_IN_FLIGHT", 10))
+
+# Max fetches in flight against a single host
+MAX_PER_HOST = int(os.getenv("POLL_MAX_PER_HOST", 5))
+
+# Max fetches started per second across all hosts (0 = unlimited)
+MAX_REQUESTS_PER_SECOND = float(os.getenv("POLL_MAX_RPS", 0))
+
+logger = logging.getLogger("discord_monitor.poller")
+
+# One semaphore per host, shared by every poll_all() call
+_host_limits = {}
+_host_limits_lock = Lock()
+
+
+class _RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_rate_limiter = _RateLimiter(MAX_REQUESTS_PER_SECOND)
+
+
+def _host_semaphore(host):
+    """Return the shared concurrency cap for a host."""
+    with _host_limits_lock:
+        sem = _host_limits.get(host)
+        if sem is None:
+            sem = BoundedSemaphore(MAX_PER_HOST)
+            _host_limits[host] = sem
+        return sem
+
+
+def poll_all(jobs, fetch, host_of, max_workers=None, per_host=None):
+    """
+    Run fetch(job) for every job concurrently.
+
+    host_of(job) returns the host the job talks to, used for the
+    per-host cap. per_host overrides POLL_MAX_PER_HOST for this call
+    only (for one-off bulk jobs such as manage.py bootstrap). Returns a
+    list of (job, result, error) tuples in the same order as jobs, so
+    callers can apply results deterministically no matter which fetch
+    finished first.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return []
+
+    workers = min(max_workers or MAX_IN_FLIGHT, len(jobs))
+
+    limits = {}
+    limits_lock = Lock()
+
+    def semaphore(host):
+        if per_host is None:
+            return _host_semaphore(host)
+        with limits_lock:
+            return limits.setdefault(host, BoundedSemaphore(per_host))
+
+    def run(job):
+        with semaphore(host_of(job)):
+            _rate_limiter.acquire()
+            return fetch(job)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="poll") as pool:
+        futures = [pool.submit(run, job) for job in jobs]
+
+    results = []
+    for job, future in zip(jobs, futures):
+        error = future.exception()
+        results.append((job, None if error else future.result(), error))
+
+    logger.debug(f"Polled {len(jobs)} jobs with {workers} workers")
+    return results
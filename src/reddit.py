@@ -0,0 +1,92 @@
+"""
+reddit.py
+Fetch new posts for many subreddits with Reddit's public JSON listings.
+
+Reddit serves a merged listing for "r/a+b+c/new", so one request covers
+a whole batch of subreddits. Post IDs are base-36 counters shared by all
+of Reddit, which makes a post's fullname ("t3_abc12") a global
+high-watermark: anything with a larger ID is newer.
+"""
+
+import os
+import logging
+from urllib.parse import urlparse
+
+import http_client
+from circuit import CircuitOpenError
+from metrics import REDDIT_REQUESTS
+
+# Listing endpoint (selfcheck.py points it at a local fake)
+REDDIT_URL = os.getenv("REDDIT_URL", "https://www.reddit.com").rstrip("/")
+REDDIT_HOST = urlparse(REDDIT_URL).netloc
+
+# Reddit throttles generic user agents hard
+REDDIT_USER_AGENT = os.getenv("REDDIT_USER_AGENT", "discord-monitor/0.4")
+
+# Posts per listing page (Reddit's maximum is 100)
+LISTING_LIMIT = 100
+
+logger = logging.getLogger("discord_monitor.reddit")
+
+
+def post_number(fullname):
+    """Numeric value of a fullname ("t3_abc12") or bare ID, for ordering."""
+    return int(fullname.rpartition("_")[2], 36)
+
+
+def _parse_post(child):
+    data = child.get("data") or {}
+    if child.get("kind") != "t3" or not data.get("name") or not data.get("subreddit"):
+        return None
+
+    thumbnail = data.get("thumbnail") or ""
+    return {
+        "fullname": data["name"],
+        "number": post_number(data["name"]),
+        "subreddit": data["subreddit"].lower(),
+        "title": data.get("title") or "",
+        "permalink": REDDIT_URL + (data.get("permalink") or ""),
+        "created": data.get("created_utc") or 0,
+        "flair": data.get("link_flair_text"),
+        "thumbnail_url": thumbnail if thumbnail.startswith("http") else None,
+    }
+
+
+def fetch_listing(subreddits, after=None):
+    """
+    Fetch one page of the merged /new listing for a batch of subreddits.
+
+    Returns a dict:
+        error  - True if the listing could not be fetched or read
+        status - HTTP status code, or None if no response arrived
+        posts  - list of post dicts, newest first
+        after  - fullname to pass for the next (older) page, or None
+    """
+    url = f"{REDDIT_URL}/r/{'+'.join(subreddits)}/new.json"
+    params = {"limit": LISTING_LIMIT, "raw_json": 1}
+    if after:
+        params["after"] = after
+
+    result = {"error": False, "status": None, "posts": [], "after": None}
+
+    try:
+        response = http_client.get(url, params=params, headers={"User-Agent": REDDIT_USER_AGENT})
+        result["status"] = response.status_code
+        response.raise_for_status()
+        listing = response.json().get("data") or {}
+    except CircuitOpenError as e:
+        REDDIT_REQUESTS.inc(result="error")
+        result["error"] = True
+        logger.debug("Reddit request skipped for %d subreddits: %s", len(subreddits), e)
+        return result
+    except Exception as e:
+        REDDIT_REQUESTS.inc(result="error")
+        result["error"] = True
+        logger.warning("Reddit request failed for %d subreddits: %s", len(subreddits), e)
+        return result
+
+    REDDIT_REQUESTS.inc(result="ok")
+    posts = (_parse_post(child) for child in listing.get("children") or [])
+    result["posts"] = [p for p in posts if p]
+    result["after"] = listing.get("after")
+    return result
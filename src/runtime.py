@@ -0,0 +1,198 @@
+"""
+runtime.py
+
+Runtime for monitor modules.
+Modules register with their own interval, concurrency budget and
+timeout, and run in parallel on a shared executor, so a slow module
+never delays the others. Each run gets a ModuleContext carrying its
+budget and deadline. Modules check ctx.expired() between jobs and
+phases and wind down once their timeout has passed.
+
+    runtime.register("reddit", check_reddit, interval=600, concurrency=4, timeout=120)
+
+A module is a callable taking the context: check_reddit(ctx).
+"""
+
+import os
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Lock
+from dotenv import load_dotenv
+
+from metrics import CYCLE_SECONDS, CYCLE_LAST_SECONDS, MODULE_TIMEOUTS
+
+load_dotenv()
+
+# Default interval for modules that don't set one (seconds)
+CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 300))
+
+# Run times are rounded up to a grid of this many seconds
+SCHEDULER_TICK = int(os.getenv("SCHEDULER_TICK", 10))
+
+# Modules allowed to run at the same time
+MODULE_WORKERS = int(os.getenv("MODULE_WORKERS", 4))
+
+logger = logging.getLogger("discord_monitor.runtime")
+
+
+class ModuleContext:
+    """Per-run view of a module's budget and deadline."""
+
+    def __init__(self, module):
+        self.name = module.name
+        self.concurrency = module.concurrency
+        self.deadline = time.monotonic() + module.timeout if module.timeout else None
+
+    def expired(self):
+        """True once the timeout has passed; long loops should stop early."""
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+class MonitorModule:
+    def __init__(self, name, func, interval, concurrency, timeout, next_due):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.next_due = next_due
+
+        self.next_run = 0.0
+        self.slot = 0.0  # scheduled start of the current run
+        self.future = None
+        self.context = None
+        self.timed_out = False
+
+
+class ModuleRuntime:
+    """Schedules registered modules and runs them on a shared thread pool."""
+
+    def __init__(self, max_workers=MODULE_WORKERS, tick=SCHEDULER_TICK):
+        self.max_workers = max_workers
+        self.tick = tick
+        self.modules = {}
+        self._executor = None
+        self._lock = Lock()
+
+    def register(self, name, func, interval=CHECK_INTERVAL, concurrency=None, timeout=None, next_due=None):
+        """
+        Add a module. interval is the longest gap between runs; next_due,
+        if given, returns an earlier wall-clock time the module wants to
+        run at (e.g. from an adaptive scheduler). concurrency is the
+        module's budget for parallel requests; timeout is how long a run
+        may take before it is reported and asked to stop.
+        """
+        with self._lock:
+            if name in self.modules:
+                raise ValueError(f"Module already registered: {name}")
+            self.modules[name] = MonitorModule(name, func, interval, concurrency, timeout, next_due)
+        logger.info(f"Registered module {name} (every {interval}s)")
+
+    def monitor(self, name, **options):
+        """Decorator form of register()."""
+        def decorator(func):
+            self.register(name, func, **options)
+            return func
+        return decorator
+
+    def run_due(self, now=None):
+        """Start every idle module whose next run has come; reap finished runs."""
+        now = now or time.time()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="module")
+
+            for module in self.modules.values():
+                if module.future is not None:
+                    if module.future.done():
+                        self._finish(module)
+                    else:
+                        self._check_timeout(module)
+                        continue
+
+                if now >= module.next_run:
+                    self._start(module, now)
+
+    def expedite(self):
+        """Run every idle module on the next run_due() (e.g. after a config change)."""
+        with self._lock:
+            for module in self.modules.values():
+                if module.future is None:
+                    module.next_run = 0.0
+
+    def running(self):
+        with self._lock:
+            return [m.name for m in self.modules.values() if m.future is not None]
+
+    def shutdown(self, timeout=None):
+        """Wait up to timeout for running modules, then stop the pool."""
+        with self._lock:
+            futures = [m.future for m in self.modules.values() if m.future is not None]
+            executor, self._executor = self._executor, None
+
+        if futures:
+            _, pending = wait(futures, timeout=timeout)
+            if pending:
+                logger.warning(f"{len(pending)} module run(s) still active at shutdown")
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _start(self, module, now):
+        # Measure the interval from the scheduled start, not from when the
+        # run ends, so a module's cadence doesn't drift by its run time
+        module.slot = module.next_run or now
+        module.context = ModuleContext(module)
+        module.timed_out = False
+        module.future = self._executor.submit(self._run, module, module.context)
+
+    def _run(self, module, context):
+        logger.info(f"===== Module {module.name} started =====")
+        start = time.monotonic()
+        try:
+            module.func(context)
+        except Exception as e:
+            logger.exception(f"Module {module.name} failed: {e}")
+        finally:
+            duration = time.monotonic() - start
+            CYCLE_SECONDS.observe(duration, module=module.name)
+            CYCLE_LAST_SECONDS.set(duration, module=module.name)
+            logger.info(f"===== Module {module.name} finished in {duration:.1f}s =====")
+
+    def _check_timeout(self, module):
+        if module.timed_out or not module.context.expired():
+            return
+        # Threads can't be killed; the run sees ctx.expired() and winds
+        # down at its next check, and is not overlapped meanwhile
+        module.timed_out = True
+        MODULE_TIMEOUTS.inc(module=module.name)
+        logger.warning(f"Module {module.name} exceeded its {module.timeout}s timeout")
+
+    def _finish(self, module):
+        module.future = None
+        module.context = None
+
+        now = time.time()
+        target = module.slot + module.interval
+        if target <= now and module.interval > 0:
+            # Skip slots missed while the run was going
+            target += math.ceil((now - target) / module.interval) * module.interval
+            if target <= now:
+                target += module.interval
+        if module.next_due:
+            try:
+                next_due = module.next_due()
+            except Exception as e:
+                logger.exception(f"next_due for module {module.name} failed: {e}")
+                next_due = None
+            if next_due is not None:
+                target = min(target, next_due)
+
+        # Round up to the tick grid
+        module.next_run = math.ceil(target / self.tick) * self.tick
+        logger.info(f"Module {module.name} next run in {max(module.next_run - now, 0):.0f}s")
+
+
+# Shared runtime for the whole bot
+runtime = ModuleRuntime()
@@ -0,0 +1,253 @@
+"""
+scheduler.py
+
+Adaptive per-channel polling schedule.
+Keeps each channel's next-due time in a priority queue and adapts its
+interval to the channel's observed upload cadence, polling quickly
+around the hours it usually publishes and rarely when it is quiet.
+
+Due times sit on a fixed per-channel grid offset by a deterministic
+hash of the URL, so checks are spread evenly across each interval and
+don't drift by however long a cycle took.
+"""
+
+import os
+import json
+import heapq
+import math
+import hashlib
+import logging
+from datetime import datetime, timezone
+from threading import Lock
+from dotenv import load_dotenv
+
+from db import get_poll_schedule, save_poll_schedule_many
+
+load_dotenv()
+
+# Interval used until a channel has upload history
+CHECK_INTERVAL = int(os.getenv("CHECK_INTERVAL", 300))
+
+# Bounds for adaptive intervals (seconds)
+POLL_MIN_INTERVAL = int(os.getenv("POLL_MIN_INTERVAL", 300))
+POLL_MAX_INTERVAL = int(os.getenv("POLL_MAX_INTERVAL", 6 * 3600))
+
+# Polls per average gap between uploads
+POLL_CHECKS_PER_UPLOAD = float(os.getenv("POLL_CHECKS_PER_UPLOAD", 6))
+
+# Share of uploads within ±1h of an hour for it to count as a usual publish hour
+POLL_HOT_HOUR_SHARE = float(os.getenv("POLL_HOT_HOUR_SHARE", 0.25))
+
+# Set to false to poll every channel every CHECK_INTERVAL
+ADAPTIVE_POLLING = os.getenv("ADAPTIVE_POLLING", "true").lower() == "true"
+
+# Weight of the newest gap in the moving average, and hourly histogram decay
+GAP_SMOOTHING = 0.3
+HOUR_DECAY = 0.9
+
+# Decayed upload weight needed before publish hours are trusted
+MIN_HOUR_WEIGHT = 2.0
+
+logger = logging.getLogger("discord_monitor.scheduler")
+
+
+def _parse_ts(value):
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _hour(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).hour
+
+
+def _phase(url):
+    """Deterministic jitter in [0, 1) for a channel."""
+    digest = hashlib.sha1(url.encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def _align(url, now, interval):
+    """
+    Next point on the channel's grid ((k + phase) * interval) that is at
+    least half an interval away. Consecutive checks land exactly one
+    interval apart regardless of when the previous check ran.
+    """
+    phase = _phase(url)
+    k = math.ceil((now + interval / 2) / interval - phase)
+    return (k + phase) * interval
+
+
+class AdaptiveScheduler:
+    """
+    Priority queue of (next_due, url) with per-channel cadence state.
+    Heap entries are invalidated lazily: an entry only counts if its due
+    time still matches the channel's state. The heap only answers
+    next_due(); whether a channel is due is read from its state.
+    """
+
+    def __init__(self, platform):
+        self.platform = platform
+        self._lock = Lock()
+        self._heap = []
+        self._state = None
+        self._dirty = set()
+
+        # If set, every channel uses this interval (e.g. a WebSub reconciliation sweep)
+        self.fixed_interval = None
+
+    def _load(self):
+        if self._state is None:
+            self._state = {}
+            for url, next_due, mean_gap, last_upload, hours in get_poll_schedule(self.platform):
+                self._state[url] = {
+                    "next_due": next_due,
+                    "mean_gap": mean_gap,
+                    "last_upload": last_upload,
+                    "hours": json.loads(hours) if hours else [0.0] * 24,
+                }
+                heapq.heappush(self._heap, (next_due, url))
+
+    def due(self, urls, now):
+        """
+        Return the subset of urls due at now, in the given order.
+        New channels are due immediately. Due channels are provisionally
+        rescheduled, so a channel that errors out is still polled again.
+
+        A channel that comes due while left out of urls (no webhook,
+        owned by another replica) keeps its overdue next_due and is due
+        the next time it is passed in.
+        """
+        with self._lock:
+            self._load()
+            due = set()
+
+            # Drop heap entries that have come due; the state decides below
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+
+            for url in urls:
+                state = self._state.get(url)
+                if state is None:
+                    self._state[url] = {
+                        "next_due": now, "mean_gap": None, "last_upload": None,
+                        "hours": [0.0] * 24,
+                    }
+                    due.add(url)
+                elif state["next_due"] <= now:
+                    due.add(url)
+
+            for url in due:
+                self._reschedule(url, now)
+
+            return [url for url in urls if url in due]
+
+    def observe(self, url, entries, now):
+        """
+        Update a channel's cadence from freshly parsed feed entries
+        (None or [] if nothing new was learned) and reschedule it.
+        """
+        with self._lock:
+            self._load()
+            state = self._state.get(url)
+            if state is None:
+                return
+
+            published = sorted(
+                ts for ts in (_parse_ts(e.get("published")) for e in entries or []) if ts
+            )
+
+            for ts in published:
+                if state["last_upload"] is not None:
+                    if ts <= state["last_upload"]:
+                        continue
+                    gap = ts - state["last_upload"]
+                    if state["mean_gap"] is None:
+                        state["mean_gap"] = gap
+                    else:
+                        state["mean_gap"] += GAP_SMOOTHING * (gap - state["mean_gap"])
+
+                hours = state["hours"]
+                for h in range(24):
+                    hours[h] *= HOUR_DECAY
+                hours[_hour(ts)] += 1.0
+                state["last_upload"] = ts
+
+            self._reschedule(url, now)
+
+    def defer(self, url, now):
+        """Make a channel due again at now (e.g. it was skipped after being picked by due())."""
+        with self._lock:
+            self._load()
+            state = self._state.get(url)
+            if state is None:
+                return
+            state["next_due"] = now
+            heapq.heappush(self._heap, (now, url))
+            self._dirty.add(url)
+
+    def next_due(self):
+        """Earliest due time of any channel, or None if none are scheduled."""
+        with self._lock:
+            self._load()
+            while self._heap:
+                next_due, url = self._heap[0]
+                state = self._state.get(url)
+                if state is not None and state["next_due"] == next_due:
+                    return next_due
+                heapq.heappop(self._heap)
+            return None
+
+    def save(self):
+        """Persist changed channel schedules in one transaction."""
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [
+                (url, s["next_due"], s["mean_gap"], s["last_upload"], json.dumps(s["hours"]))
+                for url, s in ((url, self._state[url]) for url in self._dirty)
+            ]
+            self._dirty.clear()
+
+        save_poll_schedule_many(rows, platform=self.platform)
+
+    # ================= INTERVALS =================
+
+    def _is_hot_hour(self, state, hour):
+        hours = state["hours"]
+        total = sum(hours)
+        if total < MIN_HOUR_WEIGHT:
+            return False
+        window = hours[(hour - 1) % 24] + hours[hour] + hours[(hour + 1) % 24]
+        return window / total >= POLL_HOT_HOUR_SHARE
+
+    def _reschedule(self, url, now):
+        state = self._state[url]
+
+        if self.fixed_interval:
+            next_due = _align(url, now, self.fixed_interval)
+        elif not ADAPTIVE_POLLING:
+            next_due = _align(url, now, CHECK_INTERVAL)
+        elif self._is_hot_hour(state, _hour(now)):
+            next_due = _align(url, now, POLL_MIN_INTERVAL)
+        else:
+            if state["mean_gap"] is None:
+                interval = CHECK_INTERVAL
+            else:
+                interval = state["mean_gap"] / POLL_CHECKS_PER_UPLOAD
+            interval = max(POLL_MIN_INTERVAL, min(POLL_MAX_INTERVAL, interval))
+            next_due = _align(url, now, interval)
+
+            # Wake up early for the next usual publish hour
+            boundary = (now // 3600 + 1) * 3600
+            while boundary < next_due:
+                if self._is_hot_hour(state, _hour(boundary)):
+                    early = boundary + _phase(url) * POLL_MIN_INTERVAL
+                    next_due = max(min(early, next_due), now + POLL_MIN_INTERVAL)
+                    break
+                boundary += 3600
+
+        state["next_due"] = next_due
+        heapq.heappush(self._heap, (next_due, url))
+        self._dirty.add(url)
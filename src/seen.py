@@ -0,0 +1,129 @@
+"""
+seen.py
+Bounded history of item IDs already seen per channel.
+
+Stored in the seen_items table so reordered feeds, reposts and premieres
+that flip back and forth are recognised across restarts. A bounded LRU
+cache sits in front: a cycle loads all due channels in one query, and
+lookups in the hot loop are plain dict reads. New IDs are staged,
+written with the cycle's detections, and only become "seen" in memory
+once that transaction commits, so a failed write never hides a video
+from the next cycle.
+"""
+
+import os
+import time
+import logging
+from collections import OrderedDict
+from threading import Lock
+from dotenv import load_dotenv
+
+from db import get_seen_items, compact_seen_items
+from sharding import shard
+from metrics import DB_WRITE_SECONDS
+
+load_dotenv()
+
+# Item IDs kept per channel, in memory and in the database
+SEEN_IDS_PER_CHANNEL = int(os.getenv("SEEN_IDS_PER_CHANNEL", 50))
+
+# Channels whose history is kept in memory (least recently used are dropped)
+SEEN_CACHE_CHANNELS = int(os.getenv("SEEN_CACHE_CHANNELS", 2000))
+
+# Rows deleted per transaction when trimming old history
+SEEN_COMPACT_BATCH = int(os.getenv("SEEN_COMPACT_BATCH", 1000))
+
+logger = logging.getLogger("discord_monitor.seen")
+
+
+class SeenCache:
+    """Write-behind LRU cache of one platform's seen item IDs."""
+
+    def __init__(self, platform, per_channel=SEEN_IDS_PER_CHANNEL, max_channels=SEEN_CACHE_CHANNELS):
+        self.platform = platform
+        self.per_channel = per_channel
+        self.max_channels = max_channels
+        self._channels = OrderedDict()  # channel -> {item_id: True}, oldest first
+        self._pending = []              # (channel, item_id, first_seen_ts) not yet written
+        self._staged = set()            # (channel, item_id) in _pending
+        self._lock = Lock()
+
+    def load(self, channels):
+        """Bring channels' history into memory with one query for those not cached."""
+        with self._lock:
+            missing = [c for c in channels if c not in self._channels]
+        if not missing:
+            return
+
+        stored = get_seen_items(missing, platform=self.platform)
+        with self._lock:
+            for channel in missing:
+                if channel not in self._channels:
+                    self._channels[channel] = dict.fromkeys(stored.get(channel, [])[-self.per_channel:], True)
+            # A cycle's own channels stay cached even past the cap
+            self._evict(keep=len(missing))
+
+    def get(self, channel):
+        """Return the channel's seen IDs (a dict used as an ordered set)."""
+        with self._lock:
+            seen = self._channels.get(channel)
+            if seen is not None:
+                self._channels.move_to_end(channel)
+                return seen
+
+        self.load([channel])
+        with self._lock:
+            return self._channels[channel]
+
+    def remember(self, channel, item_ids):
+        """Stage IDs (newest first) as seen; they count once commit() is called."""
+        seen = self.get(channel)
+        now = time.time()
+        with self._lock:
+            # Microsecond steps keep a batch's feed order in first_seen_ts
+            for i, item_id in enumerate(reversed(item_ids)):
+                if item_id not in seen and (channel, item_id) not in self._staged:
+                    self._staged.add((channel, item_id))
+                    self._pending.append((channel, item_id, now + i * 1e-6))
+
+    def drain(self):
+        """
+        Return and clear the staged rows, to be written by
+        db.record_detections. Call commit() with them once that succeeds;
+        if it fails they are dropped and the next cycle stages them again.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._staged.clear()
+        return pending
+
+    def commit(self, rows):
+        """Apply written rows to the in-memory history, evicting the oldest past the cap."""
+        with self._lock:
+            for channel, item_id, _ in rows:
+                seen = self._channels.get(channel)
+                if seen is None:
+                    # Evicted meanwhile; the next load reads it from the database
+                    continue
+                seen[item_id] = True
+                while len(seen) > self.per_channel:
+                    del seen[next(iter(seen))]
+
+    def _evict(self, keep=0):
+        while len(self._channels) > max(self.max_channels, keep):
+            self._channels.popitem(last=False)
+
+
+def compact(ctx=None):
+    """
+    Trim stored history to SEEN_IDS_PER_CHANNEL items per channel.
+    Runs as a runtime module; only the shard leader compacts, since
+    every replica shares the database.
+    """
+    if not shard.is_leader():
+        return
+
+    with DB_WRITE_SECONDS.time(op="compact_seen_items"):
+        deleted = compact_seen_items(SEEN_IDS_PER_CHANNEL, batch=SEEN_COMPACT_BATCH)
+    if deleted:
+        logger.info(f"Compacted seen history: {deleted} old items removed")
@@ -0,0 +1,436 @@
+"""
+selfcheck.py
+
+Offline end-to-end checks against local stand-ins for outside services.
+Each check starts its fakes, drives the real bot code against them with
+a throwaway database and reports what it saw. Nothing leaves the machine.
+
+    websub   fake hub: subscribe, verification GET, signed push, outbox row
+    reddit   fake listings: merged batches, base-36 watermarks, paging and
+             isolating a banned subreddit
+
+Usage:
+    python selfcheck.py                      # every check
+    python selfcheck.py websub -v
+"""
+
+import os
+import sys
+import json
+import hmac
+import time
+import socket
+import secrets
+import argparse
+import logging
+import tempfile
+import multiprocessing
+import urllib.request
+from http.server import BaseHTTPRequestHandler
+from threading import Lock, Thread
+from urllib.parse import urlencode, urlparse, parse_qs
+
+from bench import _QuietServer, FEED_HEAD, FEED_ENTRY
+
+# Each check runs in a fresh process, since bot modules read their
+# environment at import time
+_ctx = multiprocessing.get_context("spawn")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(predicate, timeout=10):
+    """Poll predicate until it is true or timeout passes; returns its last value."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = predicate()
+        if result or time.monotonic() >= deadline:
+            return result
+        time.sleep(0.05)
+
+
+# ================= FAKE HUB =================
+
+class _FakeHubHandler(BaseHTTPRequestHandler):
+    """Accepts subscription requests and verifies them asynchronously, like a real hub."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode()).items()}
+
+        if params.get("hub.mode") not in ("subscribe", "unsubscribe") or not params.get("hub.callback"):
+            self._reply(400)
+            return
+
+        self._reply(202)
+        Thread(target=self.server.verify, args=(params,), daemon=True).start()
+
+
+class FakeHub(_QuietServer):
+    """
+    Minimal WebSub hub. Verified subscriptions are kept per topic, and
+    publish() pushes a feed to the subscriber, signed with its secret.
+    """
+
+    def __init__(self, address):
+        super().__init__(address, _FakeHubHandler)
+        self.lock = Lock()
+        self.subscriptions = {}  # topic -> (callback, secret)
+        self.verifications = []  # (topic, mode, verified)
+
+    def verify(self, params):
+        topic = params["hub.topic"]
+        mode = params["hub.mode"]
+        challenge = secrets.token_hex(8)
+        query = urlencode({
+            "hub.mode": mode,
+            "hub.topic": topic,
+            "hub.challenge": challenge,
+            "hub.lease_seconds": params.get("hub.lease_seconds", "3600"),
+        })
+
+        try:
+            with urllib.request.urlopen(f"{params['hub.callback']}?{query}", timeout=5) as response:
+                verified = response.status == 200 and response.read().decode() == challenge
+        except OSError:
+            verified = False
+
+        with self.lock:
+            self.verifications.append((topic, mode, verified))
+            if verified and mode == "subscribe":
+                self.subscriptions[topic] = (params["hub.callback"], params.get("hub.secret", ""))
+            elif verified:
+                self.subscriptions.pop(topic, None)
+
+    def publish(self, topic, body, secret=None):
+        """Push body to the topic's subscriber; returns the callback's status."""
+        with self.lock:
+            callback, subscribed_secret = self.subscriptions[topic]
+        secret = subscribed_secret if secret is None else secret
+
+        headers = {"Content-Type": "application/atom+xml"}
+        if secret:
+            digest = hmac.new(secret.encode(), body, "sha1").hexdigest()
+            headers["X-Hub-Signature"] = f"sha1={digest}"
+
+        request = urllib.request.Request(callback, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+
+
+def _render_push(channel_id, video_id, published):
+    entry = FEED_ENTRY.format(
+        video_id=video_id, channel_id=channel_id, n=video_id, padding="",
+        published=time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(published)),
+    )
+    return (FEED_HEAD.format(channel_id=channel_id) + entry + "</feed>\n").encode()
+
+
+def check_websub(opts, results):
+    """Subscribe through a fake hub, take a signed push and look for its outbox row (child process)."""
+    workdir = tempfile.mkdtemp(prefix="selfcheck-")
+    hub = FakeHub(("127.0.0.1", 0))
+    Thread(target=hub.serve_forever, daemon=True).start()
+    callback_port = _free_port()
+    secret = secrets.token_hex(16)
+
+    # Configure before any bot module reads its environment
+    os.environ.update({
+        "WEBSUB_ENABLED": "true",
+        "WEBSUB_HUB_URL": f"http://127.0.0.1:{hub.server_address[1]}/subscribe",
+        "WEBSUB_CALLBACK_URL": f"http://127.0.0.1:{callback_port}/websub",
+        "WEBSUB_SECRET": secret,
+        "CHECK_WEBHOOK": "http://127.0.0.1:9/unused",
+        "METRICS_PORT": "0",
+    })
+
+    logging.basicConfig(level=logging.INFO if opts["verbose"] else logging.CRITICAL)
+
+    import db
+    db.DB_PATH = os.path.join(workdir, "selfcheck.db")
+    db.init_db()
+
+    import channel_cache
+    channel_cache.CACHE_FILE = os.path.join(workdir, "channel_cache.json")
+
+    from websub import WebSubService, topic_url
+    from monitor_youtube import handle_pushed_entries
+
+    channel_id = "UCselfcheck0000000000001"
+    url = f"https://www.youtube.com/channel/{channel_id}"
+    topic = topic_url(channel_id)
+    db.add_channel("selfcheck", url, "CHECK_WEBHOOK")
+
+    # A bootstrapped channel; pushes for channels without one wait for the poll cycle
+    db.update_last_seen(url, "selfcheck-old", platform="youtube")
+
+    service = WebSubService(on_entries=handle_pushed_entries, host="127.0.0.1", port=callback_port)
+    service.start()
+    try:
+        subscribed = _wait_for(lambda: topic in hub.subscriptions)
+        results.put(("subscribe + verification GET", bool(subscribed), f"hub verifications: {hub.verifications}"))
+
+        lease = db.get_websub_leases().get(channel_id)
+        results.put(("lease stored", lease is not None and lease > time.time(), f"lease expires {lease}"))
+        if not subscribed:
+            return
+
+        # A push with the wrong signature is acknowledged but dropped
+        status = hub.publish(topic, _render_push(channel_id, "selfcheck-forged", time.time()), secret="wrong")
+        time.sleep(0.5)
+        results.put(("forged push dropped", status == 204 and db.count_outbox() == 0,
+                     f"status {status}, {db.count_outbox()} outbox rows"))
+
+        status = hub.publish(topic, _render_push(channel_id, "selfcheck-new", time.time()))
+        _wait_for(lambda: db.count_outbox() >= 1)
+        payloads = [r[0] for r in db.get_connection().execute("SELECT payload FROM outbox")]
+        results.put(("signed push queued", status == 204 and len(payloads) == 1 and "selfcheck-new" in payloads[0],
+                     f"status {status}, outbox {payloads}"))
+        results.put(("last_seen advanced", db.get_last_seen_for_channel(url) == "selfcheck-new",
+                     f"last_seen {db.get_last_seen_for_channel(url)}"))
+    finally:
+        service.stop()
+        hub.shutdown()
+
+
+# ================= FAKE REDDIT =================
+
+class _FakeRedditHandler(BaseHTTPRequestHandler):
+    """Serves /r/a+b+c/new.json merged listings, newest first, paged by ?after=."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _reply(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) != 3 or parts[0] != "r" or parts[2] != "new.json":
+            self._reply(404)
+            return
+
+        names = {name.lower() for name in parts[1].split("+")}
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        self.server.requests.append((tuple(sorted(names)), params.get("after")))
+
+        # Like Reddit, one banned subreddit fails the whole merged listing
+        if names & self.server.banned:
+            self._reply(404, b'{"reason": "banned", "error": 404}', {"Content-Type": "application/json"})
+            return
+
+        body = json.dumps(self.server.render_listing(names, params)).encode()
+        self._reply(200, body, {"Content-Type": "application/json"})
+
+
+class FakeReddit(_QuietServer):
+    """
+    Reddit stand-in with one global base-36 post counter, like the real
+    thing. Pages hold at most page_size posts whatever limit asks for.
+    """
+
+    def __init__(self, address, first_id=1, page_size=100):
+        super().__init__(address, _FakeRedditHandler)
+        self.lock = Lock()
+        self.next_id = first_id
+        self.page_size = page_size
+        self.posts = []          # (number, subreddit, created), oldest first
+        self.banned = set()
+        self.requests = []       # (subreddits, after) per listing request
+
+    def add_posts(self, subreddit, count):
+        """Publish count posts; returns their fullnames, oldest first."""
+        fullnames = []
+        with self.lock:
+            for _ in range(count):
+                self.posts.append((self.next_id, subreddit, time.time()))
+                fullnames.append(f"t3_{_base36(self.next_id)}")
+                self.next_id += 1
+        return fullnames
+
+    def age(self, seconds):
+        """Make every post older, as if seconds had passed without new posts."""
+        with self.lock:
+            self.posts = [(number, subreddit, created - seconds) for number, subreddit, created in self.posts]
+
+    def render_listing(self, names, params):
+        with self.lock:
+            posts = [p for p in reversed(self.posts) if p[1] in names]
+        if params.get("after"):
+            after = int(params["after"].rpartition("_")[2], 36)
+            posts = [p for p in posts if p[0] < after]
+
+        page = posts[:min(int(params.get("limit", 25)), self.page_size)]
+        children = [{
+            "kind": "t3",
+            "data": {
+                "name": f"t3_{_base36(number)}",
+                "subreddit": subreddit,
+                "title": f"Post {_base36(number)} in r/{subreddit}",
+                "permalink": f"/r/{subreddit}/comments/{_base36(number)}/",
+                "created_utc": created,
+            },
+        } for number, subreddit, created in page]
+        more = len(posts) > len(page)
+        return {"kind": "Listing", "data": {"children": children, "after": children[-1]["data"]["name"] if more else None}}
+
+
+def _base36(number):
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        number, rest = divmod(number, 36)
+        out = digits[rest] + out
+        if not number:
+            return out
+
+
+def check_reddit(opts, results):
+    """Run check_reddit() cycles against a fake Reddit and inspect watermarks and the outbox (child process)."""
+    workdir = tempfile.mkdtemp(prefix="selfcheck-")
+
+    # IDs cross from 3 to 4 base-36 digits mid-check ("zzz" < "1000"),
+    # so string comparison would miss posts
+    reddit = FakeReddit(("127.0.0.1", 0), first_id=36 ** 3 - 5, page_size=25)
+    Thread(target=reddit.serve_forever, daemon=True).start()
+
+    os.environ.update({
+        "REDDIT_URL": f"http://127.0.0.1:{reddit.server_address[1]}",
+        "REDDIT_BATCH_SIZE": "10",
+        "REDDIT_MAX_PAGES": "3",
+        "CHECK_WEBHOOK": "http://127.0.0.1:9/unused",
+        "METRICS_PORT": "0",
+    })
+
+    logging.basicConfig(level=logging.INFO if opts["verbose"] else logging.CRITICAL)
+
+    import db
+    db.DB_PATH = os.path.join(workdir, "selfcheck.db")
+    db.init_db()
+
+    from monitor_reddit import check_reddit as run_cycle
+
+    for name in ("busy", "quiet", "banned", "other"):
+        db.add_subreddit(name, "CHECK_WEBHOOK")
+    reddit.banned.add("banned")
+
+    quiet_old = reddit.add_posts("quiet", 1)
+    busy_old = reddit.add_posts("busy", 3)
+    other_old = reddit.add_posts("other", 1)
+
+    def watermarks():
+        return db.get_last_seen_many(["busy", "quiet", "banned", "other"], platform="reddit")
+
+    def outbox_titles():
+        return [json.loads(r[0])["title"] for r in db.get_connection().execute("SELECT payload FROM outbox ORDER BY id")]
+
+    try:
+        # First cycle: bootstrap watermarks, no notifications, isolate the banned name
+        run_cycle()
+        marks = watermarks()
+        expected = {"busy": busy_old[-1], "quiet": quiet_old[-1], "other": other_old[-1]}
+        results.put(("first run caches newest posts", marks == expected and db.count_outbox() == 0,
+                     f"watermarks {marks}, {db.count_outbox()} outbox rows"))
+        alone = [r for r in reddit.requests if r[0] == ("banned",)]
+        results.put(("banned subreddit isolated", bool(alone) and "banned" not in marks,
+                     f"requests {reddit.requests}"))
+
+        # Second cycle: busy pushes quiet's new post to the third page
+        reddit.requests.clear()
+        quiet_new = reddit.add_posts("quiet", 1)
+        busy_new = reddit.add_posts("busy", 60)
+        run_cycle()
+        marks = watermarks()
+        pages = [after for names, after in reddit.requests if names == ("busy", "other", "quiet")]
+        titles = outbox_titles()
+        results.put(("merged listing paged", len(pages) == 3 and len(reddit.requests) == 3,
+                     f"requests {reddit.requests}"))
+        results.put(("banned subreddit backed off", not any("banned" in r[0] for r in reddit.requests),
+                     f"requests {reddit.requests}"))
+        results.put(("base-36 watermarks advanced",
+                     marks.get("busy") == busy_new[-1] and marks.get("quiet") == quiet_new[-1]
+                     and marks.get("other") == other_old[-1] and len(busy_new[-1]) > len(busy_old[-1]),
+                     f"watermarks {marks}"))
+        results.put(("every new post queued once", len(titles) == 61 and len(set(titles)) == 61,
+                     f"{len(titles)} outbox rows"))
+
+        # Third cycle, a few minutes later: nothing new, one page, nothing queued
+        reddit.requests.clear()
+        reddit.age(300)
+        run_cycle()
+        results.put(("quiet cycle reads one page", len(reddit.requests) == 1 and len(outbox_titles()) == 61,
+                     f"requests {reddit.requests}, {len(outbox_titles())} outbox rows"))
+    finally:
+        reddit.shutdown()
+
+
+# ================= CLI =================
+
+CHECKS = {
+    "websub": check_websub,
+    "reddit": check_reddit,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end checks against local fakes.")
+    parser.add_argument("checks", nargs="*", metavar="check",
+                        help=f"checks to run: {', '.join(CHECKS)} (default: all)")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per check (default: 60)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show bot log output")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown check: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    opts = vars(parse_args(argv))
+    failed = 0
+
+    for name in opts["checks"] or CHECKS:
+        results = _ctx.Queue()
+        worker = _ctx.Process(target=CHECKS[name], args=(opts, results))
+        worker.start()
+        worker.join(opts["timeout"])
+        if worker.is_alive():
+            worker.terminate()
+            results.put(("finished in time", False, f"still running after {opts['timeout']:.0f}s"))
+        elif worker.exitcode != 0:
+            results.put(("exited cleanly", False, f"exit code {worker.exitcode}"))
+
+        while not results.empty():
+            step, ok, detail = results.get()
+            failed += not ok
+            print(f"[{'PASS' if ok else 'FAIL'}] {name}: {step}" + ("" if ok else f" ({detail})"))
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+sharding.py
+
+Splits the channel list between replicas of the bot.
+Each channel belongs to exactly one replica by rendezvous (highest
+random weight) hashing, so when a replica joins or leaves only its own
+share of channels moves. Replicas find each other through heartbeats in
+the shared SQLite database (SHARD_MODE=lease) or are numbered by hand
+(SHARD_MODE=static with SHARD_INDEX / SHARD_COUNT).
+
+Overlap while views of the membership differ is harmless:
+record_detections() only advances a channel's last_seen if nobody else
+has, so a video is queued once no matter how many replicas saw it.
+"""
+
+import os
+import time
+import socket
+import hashlib
+import logging
+from threading import Event, Lock, Thread
+from dotenv import load_dotenv
+
+from db import heartbeat_worker, get_live_workers, remove_worker
+
+load_dotenv()
+
+# off (one process owns everything), static or lease
+SHARD_MODE = os.getenv("SHARD_MODE", "off").lower()
+
+# Static sharding: this replica's index out of SHARD_COUNT
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))
+
+# Lease sharding: replica name, heartbeat period and how long until a silent replica is dropped
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+WORKER_HEARTBEAT = int(os.getenv("WORKER_HEARTBEAT", 30))
+WORKER_TTL = int(os.getenv("WORKER_TTL", 90))
+
+logger = logging.getLogger("discord_monitor.sharding")
+
+
+def _weight(key, member):
+    digest = hashlib.sha1(f"{member}\0{key}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def owner(key, members):
+    """Member that owns key, or None if there are no members."""
+    if not members:
+        return None
+    return max(members, key=lambda member: _weight(key, member))
+
+
+class ShardMembership:
+    """This replica's view of the shard members and the keys it owns."""
+
+    def __init__(self, mode=SHARD_MODE, worker_id=WORKER_ID, index=SHARD_INDEX, count=SHARD_COUNT):
+        if mode not in ("off", "static", "lease"):
+            raise ValueError(f"Unknown SHARD_MODE: {mode}")
+        if mode == "static" and not 0 <= index < count:
+            raise ValueError(f"SHARD_INDEX {index} out of range for SHARD_COUNT {count}")
+
+        self.mode = mode
+        self.worker_id = str(index) if mode == "static" else worker_id
+
+        # Bumped whenever the member list changes, so callers can rebalance
+        self.generation = 0
+
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+        if mode == "static":
+            self._members = [str(i) for i in range(count)]
+        elif mode == "lease":
+            self._members = []
+        else:
+            self._members = [self.worker_id]
+
+    @property
+    def members(self):
+        with self._lock:
+            return list(self._members)
+
+    def owns(self, key):
+        """True if this replica should poll key."""
+        if self.mode == "off":
+            return True
+        return owner(key, self.members) == self.worker_id
+
+    def is_leader(self):
+        """The oldest member runs singleton work such as draining the outbox."""
+        members = self.members
+        return bool(members) and members[0] == self.worker_id
+
+    def refresh(self, now=None):
+        """Heartbeat and reload the live member list (lease mode only)."""
+        if self.mode != "lease":
+            return
+
+        now = now or time.time()
+        heartbeat_worker(self.worker_id, now, WORKER_TTL)
+        members = get_live_workers(now, WORKER_TTL)
+
+        with self._lock:
+            changed = members != self._members
+            self._members = members
+            if changed:
+                self.generation += 1
+
+        if changed:
+            logger.info(f"Shard members ({len(members)}): {', '.join(members)}")
+
+    def start(self):
+        """Join the shard and keep heartbeating in the background."""
+        if self.mode == "off":
+            return
+
+        if self.mode == "static":
+            logger.info(f"Static shard {self.worker_id} of {len(self._members)}")
+            return
+
+        self.refresh()
+        self._thread = Thread(target=self._heartbeat_loop, name="shard-heartbeat", daemon=True)
+        self._thread.start()
+        logger.info(f"Joined shard as {self.worker_id}")
+
+    def stop(self):
+        """Leave the shard so the other replicas take over right away."""
+        if self.mode != "lease":
+            return
+
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+        remove_worker(self.worker_id)
+        logger.info(f"Left shard as {self.worker_id}")
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(WORKER_HEARTBEAT):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception(f"Shard heartbeat failed: {e}")
+
+
+# Shared membership for the whole bot
+shard = ShardMembership()
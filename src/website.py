@@ -0,0 +1,320 @@
+"""
+website.py
+
+Fetch web pages and reduce them to compact fingerprints.
+A page (or the regions matched by a simple CSS selector) is split into
+text blocks. Each block gets a 64-bit hash, and the whole text gets a
+64-bit SimHash, so a page costs a few kilobytes in SQLite instead of a
+full copy. Comparing fingerprints tells which blocks are new, and the
+SimHash distance says whether the change is more than noise.
+"""
+
+import os
+import re
+import codecs
+import hashlib
+import logging
+from collections import Counter
+from html.parser import HTMLParser
+
+import http_client
+from circuit import CircuitOpenError
+
+# Largest page body read (bytes)
+WEBSITE_MAX_BYTES = int(os.getenv("WEBSITE_MAX_BYTES", 2 * 1024 * 1024))
+
+# Most block hashes kept per page (16 hex chars each)
+WEBSITE_MAX_BLOCKS = int(os.getenv("WEBSITE_MAX_BLOCKS", 500))
+
+# Treat runs of digits as equal, so counters and timestamps are not changes
+WEBSITE_IGNORE_DIGITS = os.getenv("WEBSITE_IGNORE_DIGITS", "true").lower() == "true"
+
+# Words per SimHash shingle
+SHINGLE_SIZE = 3
+
+# Elements whose boundaries end a text block
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset",
+    "figcaption", "figure", "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+    "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table", "td",
+    "th", "tr", "ul", "br",
+}
+
+# Elements whose text is never content
+SKIP_TAGS = {"script", "style", "noscript", "template", "head", "svg"}
+
+# Elements without a closing tag
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+    "source", "track", "wbr",
+}
+
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+# Bytes searched for a <meta> charset (it must appear this early per the HTML spec)
+META_SNIFF_BYTES = 1024
+
+_SIMPLE_SELECTOR = re.compile(r"[\w-]*(?:[#.][\w-]+)*")
+_SELECTOR_PART = re.compile(r"([#.]?)([\w-]+)")
+
+logger = logging.getLogger("discord_monitor.website")
+
+
+# ================= FETCH =================
+
+def _page_encoding(response, body):
+    """
+    Encoding of a page: the Content-Type charset if the server sent one,
+    else a <meta> charset near the start of the body, else UTF-8.
+    requests falls back to ISO-8859-1 for text/html without a charset,
+    which garbles UTF-8 pages, so response.encoding is only trusted when
+    the header names it.
+    """
+    candidates = []
+    if "charset=" in response.headers.get("Content-Type", "").lower():
+        candidates.append(response.encoding)
+    match = _META_CHARSET.search(bytes(body[:META_SNIFF_BYTES]))
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+
+    for encoding in candidates:
+        try:
+            return codecs.lookup(encoding).name
+        except (LookupError, TypeError):
+            continue
+    return "utf-8"
+
+
+def fetch_page(url, etag=None, last_modified=None):
+    """
+    Fetch a page, conditionally if validators are given.
+
+    Returns a dict:
+        not_modified  - True if the server answered 304
+        error         - True if the page could not be fetched
+        status        - HTTP status code, or None if no response arrived
+        html          - decoded body (at most WEBSITE_MAX_BYTES), or None
+        etag          - ETag of the response, if any
+        last_modified - Last-Modified of the response, if any
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    result = {
+        "not_modified": False,
+        "error": False,
+        "status": None,
+        "html": None,
+        "etag": etag,
+        "last_modified": last_modified,
+    }
+
+    try:
+        response = http_client.get(url, headers=headers, stream=True)
+        result["status"] = response.status_code
+        with response:
+            if response.status_code == 304:
+                result["not_modified"] = True
+                return result
+            response.raise_for_status()
+
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=16384):
+                body += chunk
+                if len(body) >= WEBSITE_MAX_BYTES:
+                    logger.debug("Page truncated at %d bytes: %s", WEBSITE_MAX_BYTES, url)
+                    break
+
+            result["html"] = body[:WEBSITE_MAX_BYTES].decode(_page_encoding(response, body), errors="replace")
+            result["etag"] = response.headers.get("ETag")
+            result["last_modified"] = response.headers.get("Last-Modified")
+    except CircuitOpenError as e:
+        result["error"] = True
+        logger.debug("Page request skipped for %s: %s", url, e)
+    except Exception as e:
+        result["error"] = True
+        logger.warning("Page request failed for %s: %s", url, e)
+
+    return result
+
+
+# ================= EXTRACT =================
+
+def parse_selector(selector):
+    """
+    Parse a comma-separated list of simple selectors such as
+    "main", "#content", ".post", "div.article.body" into
+    (tag, id, classes) tuples. Combinators are not supported.
+    """
+    parsed = []
+    for part in (selector or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if not _SIMPLE_SELECTOR.fullmatch(part):
+            raise ValueError(f"Unsupported selector: {part}")
+        tag, elem_id, classes = None, None, set()
+        for prefix, name in _SELECTOR_PART.findall(part):
+            if prefix == "#":
+                elem_id = name
+            elif prefix == ".":
+                classes.add(name)
+            else:
+                tag = name.lower()
+        parsed.append((tag, elem_id, frozenset(classes)))
+    return parsed
+
+
+class _BlockParser(HTMLParser):
+    """Collects text blocks, optionally only inside selector matches."""
+
+    def __init__(self, selectors):
+        super().__init__(convert_charrefs=True)
+        self.selectors = selectors
+        self.blocks = []
+        self._stack = []
+        self._capture_depth = None if selectors else 0
+        self._skip_depth = None
+        self._buffer = []
+
+    def _matches(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = set((attrs.get("class") or "").split())
+        for sel_tag, sel_id, sel_classes in self.selectors:
+            if sel_tag and sel_tag != tag:
+                continue
+            if sel_id and attrs.get("id") != sel_id:
+                continue
+            if not sel_classes <= classes:
+                continue
+            return True
+        return False
+
+    def _flush(self):
+        text = " ".join("".join(self._buffer).split())
+        self._buffer = []
+        if text:
+            self.blocks.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in VOID_TAGS:
+            return
+
+        self._stack.append(tag)
+        depth = len(self._stack)
+        if self._skip_depth is None and tag in SKIP_TAGS:
+            self._skip_depth = depth
+        if self._capture_depth is None and self._matches(tag, attrs):
+            self._capture_depth = depth
+
+    def handle_endtag(self, tag):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag not in self._stack:
+            return
+
+        # Close implicitly closed children too (e.g. unterminated <p>)
+        while self._stack:
+            depth = len(self._stack)
+            if self._skip_depth == depth:
+                self._skip_depth = None
+            if self.selectors and self._capture_depth == depth:
+                self._flush()
+                self._capture_depth = None
+            if self._stack.pop() == tag:
+                break
+
+    def handle_data(self, data):
+        if self._capture_depth is not None and self._skip_depth is None:
+            self._buffer.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def extract_blocks(html, selector=None):
+    """Return the page's text blocks, limited to selector matches if given."""
+    parser = _BlockParser(parse_selector(selector))
+    parser.feed(html)
+    parser.close()
+    return parser.blocks
+
+
+# ================= FINGERPRINT =================
+
+def _normalize(text):
+    text = text.lower()
+    if WEBSITE_IGNORE_DIGITS:
+        text = re.sub(r"\d+", "0", text)
+    return text
+
+
+def _hash64(text):
+    return hashlib.blake2b(text.encode(), digest_size=8).digest()
+
+
+def block_hash(block):
+    """16-char hex hash of one text block, after normalization."""
+    return _hash64(_normalize(block)).hex()
+
+
+def simhash(words):
+    """64-bit SimHash of word shingles."""
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    if not shingles:
+        return 0
+
+    digests = [_hash64(s) for s in shingles]
+    half = len(digests) / 2
+
+    # Count set bits per position one byte column at a time
+    value = 0
+    for column in range(8):
+        counts = Counter(d[column] for d in digests)
+        for bit in range(8):
+            mask = 0x80 >> bit
+            ones = sum(n for byte, n in counts.items() if byte & mask)
+            if ones > half:
+                value |= 1 << (63 - column * 8 - bit)
+    return value
+
+
+def fingerprint(blocks):
+    """
+    Return (simhash, block_hashes) for a page's text blocks.
+    block_hashes are 16-char hex strings, one per distinct block.
+    """
+    words = _normalize(" ".join(blocks)).split()
+
+    block_hashes = []
+    seen = set()
+    for block in blocks:
+        h = block_hash(block)
+        if h not in seen:
+            seen.add(h)
+            block_hashes.append(h)
+
+    return simhash(words), block_hashes[:WEBSITE_MAX_BLOCKS]
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def pack_hashes(block_hashes):
+    """Block hashes as one compact string for storage."""
+    return "".join(block_hashes)
+
+
+def unpack_hashes(packed):
+    return [packed[i:i + 16] for i in range(0, len(packed or ""), 16)]
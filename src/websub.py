@@ -0,0 +1,245 @@
+"""
+websub.py
+
+Optional WebSub (PubSubHubbub) push mode for YouTube.
+Runs a small callback server that answers hub verification challenges,
+checks HMAC signatures on pushed Atom feeds and hands the parsed entries
+to the same detection path the poll cycle uses. A renewal thread keeps
+a subscription lease alive for every configured channel.
+"""
+
+import os
+import hmac
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+
+import http_client
+from db import get_websub_leases, update_websub_lease
+from config import config_watcher
+from channel_cache import resolve_channel_ids, load_cache
+from sharding import shard
+from youtube import iter_entries
+
+load_dotenv()
+
+# Enable push mode (polling then only runs as a slow reconciliation sweep)
+WEBSUB_ENABLED = os.getenv("WEBSUB_ENABLED", "false").lower() == "true"
+
+# Hub to subscribe through (selfcheck.py points it at a local fake hub)
+WEBSUB_HUB_URL = os.getenv("WEBSUB_HUB_URL", "https://pubsubhubbub.appspot.com/subscribe")
+
+# Public base URL the hub can reach, e.g. https://bot.example.com/websub
+WEBSUB_CALLBACK_URL = os.getenv("WEBSUB_CALLBACK_URL", "")
+
+# Local address for the callback server
+WEBSUB_HOST = os.getenv("WEBSUB_HOST", "0.0.0.0")
+WEBSUB_PORT = int(os.getenv("WEBSUB_PORT", 8080))
+
+# Shared secret for X-Hub-Signature HMACs
+WEBSUB_SECRET = os.getenv("WEBSUB_SECRET", "")
+
+# Requested lease, renewal margin and how often leases are checked (seconds)
+WEBSUB_LEASE_SECONDS = int(os.getenv("WEBSUB_LEASE_SECONDS", 5 * 86400))
+WEBSUB_RENEW_MARGIN = int(os.getenv("WEBSUB_RENEW_MARGIN", 86400))
+WEBSUB_RENEW_CHECK = int(os.getenv("WEBSUB_RENEW_CHECK", 3600))
+
+# Poll interval for the reconciliation sweep while push mode is on
+WEBSUB_RECONCILE_INTERVAL = int(os.getenv("WEBSUB_RECONCILE_INTERVAL", 6 * 3600))
+
+# Canonical feed URL the hub publishes (never the YOUTUBE_FEED_URL override)
+TOPIC_BASE = "https://www.youtube.com/feeds/videos.xml"
+
+# Largest push body accepted
+MAX_BODY_BYTES = 1024 * 1024
+
+# Digests the WebSub spec allows in X-Hub-Signature
+SIGNATURE_ALGORITHMS = {"sha1", "sha256", "sha384", "sha512"}
+
+logger = logging.getLogger("discord_monitor.websub")
+
+
+def topic_url(channel_id):
+    return f"{TOPIC_BASE}?channel_id={channel_id}"
+
+
+def _channel_id_from_topic(topic):
+    return parse_qs(urlparse(topic or "").query).get("channel_id", [None])[0]
+
+
+def _signature_ok(body, header):
+    """Check an X-Hub-Signature header ("sha1=<hex>", or sha256/sha384/sha512)."""
+    if not header or "=" not in header:
+        return False
+    algo, _, digest = header.partition("=")
+    algo = algo.lower()
+    if algo not in SIGNATURE_ALGORITHMS:
+        return False
+    expected = hmac.new(WEBSUB_SECRET.encode(), body, algo).hexdigest()
+    return hmac.compare_digest(expected, digest)
+
+
+# ================= SUBSCRIPTIONS =================
+
+def subscribe(channel_id, mode="subscribe"):
+    """Ask the hub to (un)subscribe our callback to a channel's feed."""
+    data = {
+        "hub.callback": f"{WEBSUB_CALLBACK_URL.rstrip('/')}/{channel_id}",
+        "hub.topic": topic_url(channel_id),
+        "hub.mode": mode,
+        "hub.verify": "async",
+        "hub.lease_seconds": str(WEBSUB_LEASE_SECONDS),
+    }
+    if WEBSUB_SECRET:
+        data["hub.secret"] = WEBSUB_SECRET
+
+    try:
+        response = http_client.post(WEBSUB_HUB_URL, data=data)
+    except Exception as e:
+        logger.warning("WebSub %s request failed for %s: %s", mode, channel_id, e)
+        return False
+
+    if response.status_code not in (202, 204):
+        logger.warning("WebSub hub rejected %s for %s: %s", mode, channel_id, response.status_code)
+        return False
+
+    logger.info("WebSub %s requested for %s", mode, channel_id)
+    return True
+
+
+def renew_leases(now=None):
+    """Subscribe channels that have no lease or whose lease expires soon."""
+    now = now or time.time()
+    leases = get_websub_leases()
+
+    # Each replica renews its own share; pushes are accepted by any replica
+    urls = [c["url"] for c in config_watcher.current().channels if shard.owns(c["url"])]
+    channel_ids = {cid for cid in resolve_channel_ids(urls).values() if cid}
+
+    for channel_id in sorted(channel_ids):
+        expires = leases.get(channel_id)
+        if expires is None or expires - now < WEBSUB_RENEW_MARGIN:
+            subscribe(channel_id)
+
+
+# ================= CALLBACK SERVER =================
+
+class _CallbackHandler(BaseHTTPRequestHandler):
+    """Handles /<prefix>/<channel_id> verification GETs and content POSTs."""
+
+    server_version = "DiscordMonitorWebSub/1.0"
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - %s" % (self.address_string(), fmt % args))
+
+    def _reply(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        mode = params.get("hub.mode")
+        channel_id = _channel_id_from_topic(params.get("hub.topic"))
+        challenge = params.get("hub.challenge")
+
+        if not channel_id or not challenge or mode not in ("subscribe", "unsubscribe"):
+            self._reply(404)
+            return
+
+        # Only confirm subscriptions for channels we actually monitor
+        wanted = channel_id in self.server.wanted_channel_ids()
+        if (mode == "subscribe") != wanted:
+            logger.warning("Refusing WebSub %s verification for %s", mode, channel_id)
+            self._reply(404)
+            return
+
+        if mode == "subscribe":
+            lease = int(params.get("hub.lease_seconds", WEBSUB_LEASE_SECONDS))
+            update_websub_lease(channel_id, time.time() + lease)
+            logger.info("WebSub subscription verified for %s (%ss lease)", channel_id, lease)
+
+        self._reply(200, challenge.encode())
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._reply(413 if length > MAX_BODY_BYTES else 400)
+            return
+
+        body = self.rfile.read(length)
+
+        # Per the spec, answer 2xx even for bad signatures but drop the content
+        self._reply(204)
+
+        if WEBSUB_SECRET and not _signature_ok(body, self.headers.get("X-Hub-Signature")):
+            logger.warning("Dropping WebSub push with invalid signature")
+            return
+
+        by_channel = {}
+        for entry in iter_entries([body]):
+            channel_id = entry.get("channel_id") or self.path.rstrip("/").rsplit("/", 1)[-1]
+            by_channel.setdefault(channel_id, []).append(entry)
+
+        for channel_id, entries in by_channel.items():
+            try:
+                self.server.on_entries(channel_id, entries)
+            except Exception as e:
+                logger.exception("WebSub push handling failed for %s: %s", channel_id, e)
+
+
+class WebSubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, on_entries):
+        super().__init__(address, _CallbackHandler)
+        self.on_entries = on_entries
+
+    def wanted_channel_ids(self):
+        # Read the in-memory ID cache only: renew_leases() resolved these
+        # IDs before subscribing, and resolving here would spend Data API
+        # quota inside the request handler on every verification
+        urls = {c["url"] for c in config_watcher.current().channels}
+        return {cid for url, cid in list(load_cache().items()) if cid and url in urls}
+
+
+class WebSubService:
+    """Callback server plus lease-renewal thread."""
+
+    def __init__(self, on_entries, host=WEBSUB_HOST, port=WEBSUB_PORT):
+        self.server = WebSubServer((host, port), on_entries)
+        self._stop = Event()
+        self._threads = []
+
+    def start(self):
+        if not WEBSUB_CALLBACK_URL:
+            logger.warning("WEBSUB_CALLBACK_URL not set; hub cannot reach the callback server")
+        if not WEBSUB_SECRET:
+            logger.warning("WEBSUB_SECRET not set; pushed content is not authenticated")
+
+        self._threads = [
+            Thread(target=self.server.serve_forever, name="websub-server", daemon=True),
+            Thread(target=self._renew_loop, name="websub-renew", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+        host, port = self.server.server_address[:2]
+        logger.info(f"WebSub callback server listening on {host}:{port}")
+
+    def stop(self):
+        self._stop.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _renew_loop(self):
+        while not self._stop.is_set():
+            try:
+                renew_leases()
+            except Exception as e:
+                logger.exception(f"WebSub lease renewal failed: {e}")
+            self._stop.wait(WEBSUB_RENEW_CHECK)
@@ -3,52 +3,196 @@ youtube.py
 Fetch latest video using YouTube RSS (no API quota).
 """
 
-import requests
-import re
+import os
 import logging
+from urllib.parse import urlparse
+from xml.etree.ElementTree import XMLPullParser, ParseError
 
-HEADERS = {"User-Agent": "Mozilla/5.0"}
+import http_client
+from circuit import CircuitOpenError
+from metrics import FEED_FETCH_SECONDS, FEED_PARSE_SECONDS, FEED_REQUESTS
+
+# Feed endpoint (override to point at a local stand-in, see bench.py)
+FEED_URL = os.getenv("YOUTUBE_FEED_URL", "https://www.youtube.com/feeds/videos.xml")
+FEED_HOST = urlparse(FEED_URL).netloc
+
+# Bytes read from the socket per parser feed
+FEED_CHUNK_SIZE = int(os.getenv("FEED_CHUNK_SIZE", 4096))
+
+# Feed XML namespaces
+ATOM = "{http://www.w3.org/2005/Atom}"
+YT = "{http://www.youtube.com/xml/schemas/2015}"
 
 logger = logging.getLogger("discord_monitor.youtube")
 
 
-def get_latest_video(channel_id):
+def fetch_feed(channel_id, etag=None, last_modified=None, stop_at=None):
     """
-    Fetch latest video ID, title, and thumbnail from YouTube RSS feed.
-    Returns (video_id, title, thumbnail_url) or (None, None, None)
+    Fetch a channel's RSS feed, conditionally if validators are given.
+
+    The body is parsed straight off the socket. If stop_at is a video ID,
+    reading stops once that entry has been parsed, since nothing older
+    can be new.
+
+    Returns a dict:
+        not_modified  - True if the server answered 304 (nothing parsed)
+        error         - True if the feed could not be fetched or read
+        status        - HTTP status code, or None if no response arrived
+        entries       - list of entry dicts, newest first (see iter_entries)
+        video         - (video_id, title, thumbnail_url) of the newest entry
+                        or (None, None, None)
+        etag          - ETag of the response, if any
+        last_modified - Last-Modified of the response, if any
     """
 
-    rss_url = f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
+    rss_url = f"{FEED_URL}?channel_id={channel_id}"
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    result = {
+        "not_modified": False,
+        "error": False,
+        "status": None,
+        "entries": [],
+        "video": (None, None, None),
+        "etag": etag,
+        "last_modified": last_modified,
+    }
 
     try:
-        response = requests.get(rss_url, headers=HEADERS, timeout=10)
+        with FEED_FETCH_SECONDS.time():
+            response = http_client.get(rss_url, headers=headers, stream=True)
+        result["status"] = response.status_code
+        if response.status_code == 304:
+            logger.debug("Feed not modified: %s", channel_id)
+            FEED_REQUESTS.inc(result="not_modified")
+            result["not_modified"] = True
+            response.close()
+            return result
         response.raise_for_status()
+    except CircuitOpenError as e:
+        FEED_REQUESTS.inc(result="error")
+        result["error"] = True
+        logger.debug("RSS request skipped for %s: %s", channel_id, e)
+        return result
+    except Exception as e:
+        # One line per channel; a degraded host shows up via the circuit breaker
+        FEED_REQUESTS.inc(result="error")
+        result["error"] = True
+        logger.warning("RSS request failed for %s: %s", channel_id, e)
+        return result
+
+    result["etag"] = response.headers.get("ETag")
+    result["last_modified"] = response.headers.get("Last-Modified")
+
+    # Stop reading as soon as the stored marker is reached
+    try:
+        with response, FEED_PARSE_SECONDS.time():
+            chunks = response.iter_content(chunk_size=FEED_CHUNK_SIZE)
+            for entry in iter_entries(chunks):
+                result["entries"].append(entry)
+                if entry["video_id"] == stop_at:
+                    break
     except Exception as e:
-        logger.exception(f"RSS request failed: {e}")
-        return None, None, None
+        FEED_REQUESTS.inc(result="error")
+        result["error"] = True
+        logger.warning("RSS read failed for %s: %s", channel_id, e)
+        result["entries"] = []
+        return result
 
-    # Extract first <entry> block (latest video)
-    entry = re.search(r"<entry>(.*?)</entry>", response.text, re.DOTALL)
-    if not entry:
+    FEED_REQUESTS.inc(result="ok")
+
+    if not result["entries"]:
         logger.warning("No <entry> found in RSS feed")
-        return None, None, None
+        return result
+
+    latest = result["entries"][0]
+    result["video"] = (latest["video_id"], latest["title"], latest["thumbnail_url"])
+
+    logger.debug("Latest video fetched: %s | %s", latest["video_id"], latest["title"])
+
+    return result
 
-    entry_text = entry.group(1)
 
-    # Extract video ID and title
-    video_id_match = re.search(r"<yt:videoId>(.*?)</yt:videoId>", entry_text)
-    title_match = re.search(r"<title>([^<]+)</title>", entry_text)
+def iter_entries(chunks):
+    """
+    Incrementally parse a feed from an iterable of byte chunks.
+    Yields every <entry> in feed order (newest first) as a dict with
+    video_id, channel_id, title, published, updated and thumbnail_url, as soon as
+    its closing tag has been read. Entries missing an ID or title are
+    skipped. XML entities in titles are unescaped by the parser.
+    """
+    parser = XMLPullParser(events=("end",))
+
+    for chunk in chunks:
+        try:
+            parser.feed(chunk)
+            events = list(parser.read_events())
+        except ParseError as e:
+            logger.warning("Malformed RSS feed: %s", e)
+            return
+
+        for _, elem in events:
+            if elem.tag != f"{ATOM}entry":
+                continue
+
+            video_id = elem.findtext(f"{YT}videoId")
+            channel_id = elem.findtext(f"{YT}channelId")
+            title = elem.findtext(f"{ATOM}title")
+            published = elem.findtext(f"{ATOM}published")
+            updated = elem.findtext(f"{ATOM}updated")
+
+            # Drop the subtree so memory stays flat across the feed
+            elem.clear()
+
+            if not video_id or title is None:
+                logger.warning("Could not parse video ID or title from RSS")
+                continue
+
+            yield {
+                "video_id": video_id,
+                "channel_id": channel_id,
+                "title": title,
+                "published": published,
+                "updated": updated,
+                # YouTube thumbnail (maxres may fail → Discord will fallback automatically)
+                "thumbnail_url": f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg",
+            }
+
 
-    if not video_id_match or not title_match:
-        logger.warning("Could not parse video ID or title from RSS")
-        return None, None, None
+def diff_entries(entries, last_id, seen):
+    """
+    Return entries newer than the stored marker, oldest first.
+
+    entries are newest first. Everything above last_id that is not in
+    seen (recently seen IDs for the channel) is new. If last_id has
+    dropped out of the feed and nothing has been seen yet (e.g. after a
+    restart), only the newest entry is reported to avoid a flood.
+    """
+    new = []
+    found = False
 
-    video_id = video_id_match.group(1)
-    title = title_match.group(1)
+    for entry in entries:
+        if entry["video_id"] == last_id:
+            found = True
+            break
+        if entry["video_id"] not in seen:
+            new.append(entry)
 
-    # YouTube thumbnail (maxres may fail → Discord will fallback automatically)
-    thumbnail_url = f"https://img.youtube.com/vi/{video_id}/maxresdefault.jpg"
+    if not found and not seen:
+        new = new[:1]
 
-    logger.debug(f"Latest video fetched: {video_id} | {title}")
+    new.reverse()
+    return new
 
-    return video_id, title, thumbnail_url
+
+def get_latest_video(channel_id):
+    """
+    Fetch latest video ID, title, and thumbnail from YouTube RSS feed.
+    Returns (video_id, title, thumbnail_url) or (None, None, None)
+    """
+    return fetch_feed(channel_id)["video"]